@@ -0,0 +1,196 @@
+"""
+Admission control for the processing endpoints.
+
+Every request gets a cost estimate (roughly, expected seconds of work) from
+its file type, size and page count, and is queued in one of two lanes:
+small jobs and large jobs each have their own concurrency limit, so a burst
+of long scans can only ever fill the large lane while small text uploads
+keep flowing. When a lane's queue is full, or the estimated wait for a new
+job is too long, the job is rejected with Overloaded and the endpoint
+answers 429 with a Retry-After hint instead of letting requests pile up.
+"""
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+# Rough cost model, in seconds of processing on one worker
+IMAGE_BASE_COST = 1.5          # OCR of a typical page image
+IMAGE_COST_PER_MB = 0.5
+PDF_COST_PER_PAGE = 0.05
+PDF_COST_PER_MB = 0.05
+TEXT_COST_PER_MB = 0.2
+MIN_COST = 0.01
+# Used when a PDF's page count can't be read
+ESTIMATED_PDF_PAGE_BYTES = 100 * 1024
+
+# Jobs costing more than this go to the large-job lane
+SMALL_JOB_MAX_COST = 3.0
+SMALL_LANE_CONCURRENCY = 4
+SMALL_LANE_MAX_QUEUE = 16
+SMALL_LANE_MAX_WAIT = 15.0     # seconds
+LARGE_LANE_CONCURRENCY = 1
+LARGE_LANE_MAX_QUEUE = 4
+LARGE_LANE_MAX_WAIT = 300.0    # seconds
+# Weight of the newest observation in the seconds-per-cost average
+EWMA_ALPHA = 0.2
+
+MB = 1024 * 1024
+
+
+class Overloaded(Exception):
+    """Raised when a job is not admitted; retry_after is a hint in whole seconds."""
+    def __init__(self, lane: str, retry_after: int):
+        super().__init__(f"The {lane}-job queue is full, retry in {retry_after}s")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+def job_kind(content_type: Optional[str] = None, extension: Optional[str] = None) -> str:
+    """Classifies a job as 'image', 'pdf' or 'text' from its content type or file extension."""
+    content_type = (content_type or "").lower()
+    extension = (extension or "").lower().lstrip(".")
+    if content_type.startswith("image/") or extension in ("png", "jpg", "jpeg"):
+        return "image"
+    if "pdf" in content_type or extension == "pdf":
+        return "pdf"
+    return "text"
+
+
+def count_pdf_pages(source, size_bytes: int) -> int:
+    """Reads the page count from a PDF's xref (path or bytes), or guesses it from its size."""
+    try:
+        import fitz  # PyMuPDF
+        doc = fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+        with doc:
+            return doc.page_count
+    except Exception:
+        return max(1, size_bytes // ESTIMATED_PDF_PAGE_BYTES)
+
+
+def estimate_cost(kind: str, size_bytes: int, pages: int = 1) -> float:
+    """Estimated processing time of a job in seconds."""
+    megabytes = size_bytes / MB
+    if kind == "image":
+        cost = pages * IMAGE_BASE_COST + megabytes * IMAGE_COST_PER_MB
+    elif kind == "pdf":
+        cost = pages * PDF_COST_PER_PAGE + megabytes * PDF_COST_PER_MB
+    else:
+        cost = megabytes * TEXT_COST_PER_MB
+    return max(cost, MIN_COST)
+
+
+class Ticket:
+    """
+    A job admitted to a lane. Entering the ticket waits for a free slot in
+    the lane; leaving it frees the slot and records how long the job took.
+    A ticket that will not be entered after all must be cancelled, or its
+    place in the queue is never given back.
+    """
+    __slots__ = ('lane', 'cost', 'started', 'cancelled')
+
+    def __init__(self, lane: "Lane", cost: float):
+        self.lane = lane
+        self.cost = cost
+        self.started = None
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """Gives back the queue place of a ticket that was never entered; a no-op otherwise."""
+        self.lane._cancel(self)
+
+    def __enter__(self) -> "Ticket":
+        self.lane._acquire(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.lane._release(self.cost, time.monotonic() - self.started)
+
+
+class Lane:
+    """A queue with its own concurrency limit and wait estimate."""
+    def __init__(self, name: str, concurrency: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        # Estimated cost of all admitted jobs that haven't finished yet
+        self.outstanding_cost = 0.0
+        # Moving average of measured seconds per estimated cost unit
+        self.seconds_per_cost = 1.0
+        self._cond = threading.Condition()
+
+    def _estimated_wait(self) -> float:
+        if self.active + self.waiting < self.concurrency:
+            return 0.0
+        return self.outstanding_cost * self.seconds_per_cost / self.concurrency
+
+    def estimated_wait(self) -> float:
+        with self._cond:
+            return self._estimated_wait()
+
+    def admit(self, cost: float) -> Ticket:
+        """Reserves a place in the queue, or raises Overloaded."""
+        with self._cond:
+            wait = self._estimated_wait()
+            if self.waiting >= self.max_queue or wait > self.max_wait:
+                raise Overloaded(self.name, max(1, math.ceil(wait)))
+            self.waiting += 1
+            self.outstanding_cost += cost
+        return Ticket(self, cost)
+
+    def _acquire(self, ticket: Ticket) -> None:
+        with self._cond:
+            while self.active >= self.concurrency and not ticket.cancelled:
+                self._cond.wait()
+            if ticket.cancelled:
+                raise RuntimeError("The admission ticket was cancelled")
+            self.waiting -= 1
+            self.active += 1
+            ticket.started = time.monotonic()
+
+    def _cancel(self, ticket: Ticket) -> None:
+        with self._cond:
+            if ticket.started is not None or ticket.cancelled:
+                return
+            ticket.cancelled = True
+            self.waiting -= 1
+            self.outstanding_cost = max(0.0, self.outstanding_cost - ticket.cost)
+            # Wake everyone: a thread may be waiting on this very ticket
+            self._cond.notify_all()
+
+    def _release(self, cost: float, elapsed: float) -> None:
+        with self._cond:
+            self.active -= 1
+            self.outstanding_cost = max(0.0, self.outstanding_cost - cost)
+            observed = elapsed / cost
+            self.seconds_per_cost += EWMA_ALPHA * (observed - self.seconds_per_cost)
+            self._cond.notify()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "active": self.active,
+                "waiting": self.waiting,
+                "concurrency": self.concurrency,
+                "estimated_wait": round(self._estimated_wait(), 2),
+            }
+
+
+class AdmissionController:
+    """Routes jobs to the small- or large-job lane by estimated cost."""
+    def __init__(self, small_max_cost: float = SMALL_JOB_MAX_COST):
+        self.small_max_cost = small_max_cost
+        self.small = Lane("small", SMALL_LANE_CONCURRENCY, SMALL_LANE_MAX_QUEUE, SMALL_LANE_MAX_WAIT)
+        self.large = Lane("large", LARGE_LANE_CONCURRENCY, LARGE_LANE_MAX_QUEUE, LARGE_LANE_MAX_WAIT)
+
+    def lane_for(self, cost: float) -> Lane:
+        return self.small if cost <= self.small_max_cost else self.large
+
+    def admit(self, cost: float) -> Ticket:
+        return self.lane_for(cost).admit(cost)
+
+    def stats(self) -> Dict:
+        return {"small": self.small.stats(), "large": self.large.stats()}
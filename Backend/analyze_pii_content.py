@@ -1,8 +1,10 @@
 import re
 import spacy
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 
+from regex_engine import ScanBudget, compile_patterns, iter_matches
+
 # Load spaCy model for NER
 try:
     nlp = spacy.load("en_core_web_sm")
@@ -49,24 +51,25 @@ def replace_numerical_pii(text: str, dummy_data: Dict) -> str:
             sanitized_text = re.sub(pattern, dummy_value, sanitized_text)
     return sanitized_text
 
-def detect_pii_regex(text: str) -> List[Dict[str, Any]]:
+PII_REGEX_PATTERNS = compile_patterns({
+    'email': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
+    'phone': r'\b(?:\+?1[-.\s]?)?\(?([0-9]{3})\)?[-.\s]?([0-9]{3})[-.\s]?([0-9]{4})\b',
+    'ssn': r'\b\d{3}-?\d{2}-?\d{4}\b',
+    'credit_card': r'\b(?:\d{4}[-\s]?){3}\d{4}\b',
+    'ip_address': r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b',
+    'url': r'https?://(?:[-\w.])+(?:[:\d]+)?(?:/(?:[\w/_.])*(?:\?(?:[\w&=%.])*)?(?:#(?:[\w.])*)?)?',
+}, ignore_case=True)
+
+def detect_pii_regex(text: str, budget: Optional[ScanBudget] = None) -> List[Dict[str, Any]]:
     """
-    Detect PII using regular expressions
+    Detect PII using regular expressions.
+    Patterns run on RE2 when installed; with a budget, scanning stops
+    (returning what was found so far) once the budget runs out.
     """
-    pii_patterns = {
-        'email': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
-        'phone': r'\b(?:\+?1[-.\s]?)?\(?([0-9]{3})\)?[-.\s]?([0-9]{3})[-.\s]?([0-9]{4})\b',
-        'ssn': r'\b\d{3}-?\d{2}-?\d{4}\b',
-        'credit_card': r'\b(?:\d{4}[-\s]?){3}\d{4}\b',
-        'ip_address': r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b',
-        'url': r'https?://(?:[-\w.])+(?:[:\d]+)?(?:/(?:[\w/_.])*(?:\?(?:[\w&=%.])*)?(?:#(?:[\w.])*)?)?',
-    }
-    
     detected_pii = []
     
-    for pii_type, pattern in pii_patterns.items():
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
+    for pii_type, compiled in PII_REGEX_PATTERNS.items():
+        for match in iter_matches(compiled, text, budget):
             detected_pii.append({
                 'type': pii_type,
                 'text': match.group(),
@@ -1,24 +1,27 @@
 # app.py
 
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_file
 from flask_cors import CORS
 import os
 from datetime import datetime
-from werkzeug.utils import secure_filename
 import logging
-from PIL import Image
+
+from storage import ContentStore
+from admission import AdmissionController, Overloaded, count_pdf_pages, estimate_cost, job_kind
+from profiling import (
+    ALLOCATIONS_QUERY_PARAM, PROFILE_HEADER, PROFILE_QUERY_PARAM, REQUEST_ID_HEADER,
+    maybe_profile, new_request_id, profile_store, profiling_authorized, wants_allocations
+)
 
 # Import your existing modules
 try:
     # NOTE: Ensure your analyze_pii_content.py has these functions
     from pii_analyzer import (
-        extract_text_with_boxes, 
-        detect_pii_regex, 
         YoloSignatureDetector, 
         SpacyNer, 
-        redact_boxes, 
         log_redaction
     )
+    from image_pipeline import sanitize_image_file
     MODULES_LOADED = True
 except ImportError as e:
     print(f"Warning: Some modules not found. Please ensure pii_analyzer.py exists. Details: {e}")
@@ -35,9 +38,22 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf', 'docx', 'txt', 'csv'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['PROCESSED_FOLDER'] = PROCESSED_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024 * 1024  # 16MB
+# Stored files not accessed for this long are deleted by the background sweeper
+app.config['STORAGE_TTL_SECONDS'] = 7 * 24 * 3600
+# Once a folder grows past its quota, the least recently used files are deleted
+app.config['UPLOAD_QUOTA_BYTES'] = 20 * 1024 * 1024 * 1024
+app.config['PROCESSED_QUOTA_BYTES'] = 20 * 1024 * 1024 * 1024
+app.config['STORAGE_SWEEP_INTERVAL'] = 10 * 60
+
+# Uploads and results are content-addressed and sharded (see storage.py):
+# identical uploads are stored once and neither folder grows flat.
+upload_store = ContentStore(UPLOAD_FOLDER, app.config['STORAGE_TTL_SECONDS'], app.config['UPLOAD_QUOTA_BYTES'])
+processed_store = ContentStore(PROCESSED_FOLDER, app.config['STORAGE_TTL_SECONDS'], app.config['PROCESSED_QUOTA_BYTES'])
+upload_store.start_sweeper(app.config['STORAGE_SWEEP_INTERVAL'])
+processed_store.start_sweeper(app.config['STORAGE_SWEEP_INTERVAL'])
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+# Separate small-job and large-job lanes with load shedding (see admission.py)
+admission = AdmissionController()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -72,8 +88,17 @@ def home():
 # ===============================================================
 @app.route('/processed/<filename>')
 def get_processed_file(filename):
-    """Serves a processed file from the processed directory."""
-    return send_from_directory(app.config['PROCESSED_FOLDER'], filename)
+    """
+    Serves a processed file. Names are content hashes, so the hash doubles as
+    a strong ETag and the response never changes; conditional and Range
+    requests are answered with 304 / 206 by send_file.
+    """
+    filepath = processed_store.open_path(filename)
+    if filepath is None:
+        return jsonify({"error": "File not found"}), 404
+    response = send_file(os.path.abspath(filepath), conditional=True, etag=filename.split('.')[0], max_age=app.config['STORAGE_TTL_SECONDS'])
+    response.headers['Cache-Control'] += ', immutable'
+    return response
 
 # --- API Routes (Unchanged) ---
 @app.route('/favicon.ico')
@@ -107,19 +132,21 @@ def upload_file():
         if not allowed_file(file.filename):
             return jsonify({"error": f"File type not allowed. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"}), 400
         
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{filename}"
-        
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # The original name is only echoed back, never used as a path. It is
+        # not passed through secure_filename, which drops non-ASCII names
+        # entirely ("скан.png" -> "png").
+        original_filename = os.path.basename(file.filename.replace('\\', '/'))
+        extension = file.filename.rsplit('.', 1)[1].lower()
+        # The stored name is the content hash, so identical uploads share one file
+        filename = upload_store.put_stream(file.stream, extension)
         
-        logger.info(f"File uploaded: {filename}")
-        if MODULES_LOADED: log_redaction("file_upload", {"filename": filename})
+        logger.info(f"File uploaded: {original_filename} -> {filename}")
+        if MODULES_LOADED: log_redaction("file_upload", {"filename": filename, "original_filename": original_filename})
         
         return jsonify({
             "message": "File uploaded successfully",
             "filename": filename,
+            "original_filename": original_filename,
         }), 200
         
     except Exception as e:
@@ -141,70 +168,80 @@ def process_file():
             return jsonify({"error": "Filename is required"}), 400
         
         filename = data['filename']
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        filepath = upload_store.open_path(filename)
         
-        if not os.path.exists(filepath):
+        if filepath is None:
             return jsonify({"error": "File not found on server"}), 404
         
-        start_time = datetime.now()
-        image = Image.open(filepath).convert("RGB")
-        
-        # 1. OCR to get text and bounding boxes
-        ocr_results = extract_text_with_boxes(image)
-        full_text = " ".join([item['text'] for item in ocr_results])
-        
-        boxes_to_redact = []
-        pii_found = []
-
-        # 2. Detect PII (Regex and NER) and map to boxes
-        pii_regex_matches = detect_pii_regex(full_text)
-        for pii_text in pii_regex_matches:
-            pii_found.append({"text": pii_text, "type": "regex"})
-            for item in ocr_results:
-                if pii_text in item['text']:
-                    boxes_to_redact.append(item['box'])
-                    log_redaction("regex_pii", pii_text, item['box'])
-
-        # NOTE: Initialize models once at startup for production
-        spacy_ner = SpacyNer("en_core_web_lg")
-        pii_ner_entities = spacy_ner.detect_pii(full_text)
-        for entity in pii_ner_entities:
-            pii_found.append({"text": entity['text'], "type": entity['label']})
-            for item in ocr_results:
-                if entity['text'] in item['text']:
-                    boxes_to_redact.append(item['box'])
-                    log_redaction("ner_pii", entity['text'], item['box'])
-
-        # 3. Detect Signatures
-        signature_detector = YoloSignatureDetector("path/to/model.pt")
-        signature_boxes = signature_detector.detect_signatures(image)
-        for box in signature_boxes:
-            boxes_to_redact.append(box)
-            log_redaction("signature", "signature detected", box)
-
-        # 4. Redact image if sensitive content was found
-        results = {"filename": filename}
-        if boxes_to_redact:
-            output_filename = f"redacted_{filename}"
-            output_path = os.path.join(app.config['PROCESSED_FOLDER'], output_filename)
-            
-            redact_boxes(image, boxes_to_redact, output_path, method='blackbox')
-            
-            results["redacted_file"] = output_filename
-            results["status"] = "Redacted"
-        else:
-            results["status"] = "No PII found"
+        extension = filename.rsplit('.', 1)[-1]
+        kind = job_kind(extension=extension)
+        size = os.path.getsize(filepath)
+        pages = count_pdf_pages(filepath, size) if kind == "pdf" else 1
+        try:
+            ticket = admission.admit(estimate_cost(kind, size, pages))
+        except Overloaded as e:
+            return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
+
+        # The ticket is entered straight away, so its queue place is always given back
+        output_path = None
+        try:
+            with ticket:
+                start_time = datetime.now()
+                request_id = new_request_id()
+                output_path = processed_store.temp_path(extension)
+
+                # Authorized callers can ask for this request to be profiled (see profiling.py)
+                profile_token = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_PARAM)
+                allocations = wants_allocations(request.args.get(ALLOCATIONS_QUERY_PARAM))
+                with maybe_profile(profile_token, request_id, "/api/process", allocations):
+                    # NOTE: Initialize models once at startup for production
+                    outcome = sanitize_image_file(
+                        filepath,
+                        output_path,
+                        spacy_ner=SpacyNer("en_core_web_lg"),
+                        signature_detector=YoloSignatureDetector("path/to/model.pt"),
+                        method='blackbox'
+                    )
+            pii_found = outcome["pii_detected"]
+
+            results = {"filename": filename}
+            if outcome["redacted"]:
+                results["redacted_file"] = processed_store.put_file(output_path, extension)
+                results["status"] = "Redacted"
+            else:
+                results["status"] = "No PII found"
+        finally:
+            # put_file() moves the output into the store; anything left is from a failed run or a clean file
+            if output_path is not None and os.path.exists(output_path):
+                os.remove(output_path)
 
         processing_time = (datetime.now() - start_time).total_seconds()
         results["processing_time"] = round(processing_time, 2)
         results["pii_detected"] = pii_found
         
-        return jsonify(results), 200
+        response = jsonify(results)
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response, 200
         
     except Exception as e:
         logger.error(f"Processing error: {str(e)}")
         return jsonify({"error": f"Processing failed: {str(e)}"}), 500
 
+@app.route('/api/profiles/<request_id>')
+def get_profile(request_id):
+    """
+    Returns the profile recorded for a request. Add ?format=folded to get
+    the raw folded stacks for flamegraph.pl or speedscope.
+    """
+    if not profiling_authorized(request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_PARAM)):
+        return jsonify({"error": "Not authorized"}), 403
+    profile = profile_store.get(request_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found"}), 404
+    if request.args.get('format') == 'folded':
+        return profile["folded"], 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return jsonify(profile), 200
+
 # --- Existing Error Handlers (Unchanged) ---
 @app.errorhandler(404)
 def not_found(error):
@@ -0,0 +1,391 @@
+"""
+Offline bulk sanitization.
+
+Walks one or more directory trees, sanitizes every supported file across a
+process pool and writes the results to a mirrored tree under --output.
+Progress is recorded in an SQLite manifest, so an interrupted run picks up
+where it stopped when started again with the same arguments. With --rescan,
+files whose size or modification time changed since then are redone.
+
+Usage:
+    python bulk_sanitize.py /data/incoming --output /data/sanitized
+    python bulk_sanitize.py /data/a /data/b -o /data/out --types pdf,docx --workers 16
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# --- Setup Python Path for relative imports ---
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Supported extensions and the content type the pipeline expects for them
+CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'docx': DOCX_CONTENT_TYPE,
+    'txt': 'text/plain',
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'tif': 'image/tiff',
+    'tiff': 'image/tiff',
+    'bmp': 'image/bmp',
+}
+
+MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    output TEXT,
+    pii_count INTEGER,
+    error TEXT,
+    duration REAL,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS files_status ON files (status);
+"""
+# Manifest writes are batched into one transaction per this many rows
+COMMIT_EVERY = 200
+
+
+# --- Manifest ---
+
+class Manifest:
+    """SQLite record of every discovered file and its processing state."""
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(MANIFEST_SCHEMA)
+        # Lets queries filter by --types without a column for it in older manifests
+        self.db.create_function("file_type", 1, file_type, deterministic=True)
+        self.pending_writes = 0
+
+    @staticmethod
+    def _type_filter(types: Optional[Iterable[str]]) -> Tuple[str, Tuple[str, ...]]:
+        """SQL condition (and its parameters) matching files of the given types; all files if types is None."""
+        if types is None:
+            return "1", ()
+        types = tuple(sorted(types))
+        return f"file_type(path) IN ({', '.join('?' * len(types))})", types
+
+    def add(self, rows: List[Tuple[str, str, int, float]]) -> None:
+        """Registers files; files that changed since they were last seen go back to pending."""
+        self.db.executemany("""
+            INSERT INTO files (path, root, size, mtime) VALUES (?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                root = excluded.root, size = excluded.size, mtime = excluded.mtime,
+                status = 'pending', error = NULL
+            WHERE files.size != excluded.size OR files.mtime != excluded.mtime
+        """, rows)
+        self.db.commit()
+
+    def reset_failed(self) -> None:
+        self.db.execute("UPDATE files SET status = 'pending' WHERE status = 'failed'")
+        self.db.commit()
+
+    def counts(self, types: Optional[Iterable[str]] = None) -> Dict[str, Tuple[int, int]]:
+        """Returns {status: (file count, total bytes)}, counting only files of the given types if any."""
+        condition, params = self._type_filter(types)
+        rows = self.db.execute(
+            f"SELECT status, COUNT(*), COALESCE(SUM(size), 0) FROM files WHERE {condition} GROUP BY status", params)
+        return {status: (count, size) for status, count, size in rows}
+
+    def pending(self, types: Optional[Iterable[str]] = None, page_size: int = 1000) -> Iterator[Tuple[str, str, int]]:
+        """
+        Yields pending files (of the given types, if any) in path order, one
+        page at a time so huge manifests aren't loaded at once.
+        """
+        condition, params = self._type_filter(types)
+        last_path = ""
+        while True:
+            rows = self.db.execute(
+                f"SELECT path, root, size FROM files WHERE status = 'pending' AND {condition} AND path > ? "
+                "ORDER BY path LIMIT ?", params + (last_path, page_size)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_path = rows[-1][0]
+
+    def record(self, path: str, result: Dict) -> None:
+        self.db.execute(
+            "UPDATE files SET status = ?, output = ?, pii_count = ?, error = ?, duration = ?, updated = ? WHERE path = ?",
+            (result["status"], result.get("output"), result.get("pii_count"), result.get("error"),
+             result.get("duration"), time.time(), path))
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_EVERY:
+            self.flush()
+
+    def flush(self) -> None:
+        self.db.commit()
+        self.pending_writes = 0
+
+    def close(self) -> None:
+        self.flush()
+        self.db.close()
+
+
+# --- Directory Walking ---
+
+def file_type(path: str) -> str:
+    return os.path.splitext(path)[1].lower().lstrip('.')
+
+
+def walk_files(root: str, types: set, skip_dir: Optional[str] = None) -> Iterator[os.DirEntry]:
+    """Yields matching files under root without building the full listing in memory."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if skip_dir is None or os.path.abspath(entry.path) != skip_dir:
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False) and file_type(entry.name) in types:
+                        yield entry
+        except OSError as e:
+            print(f"⚠️ Warning: Could not list '{directory}': {e}")
+
+
+def discover(manifest: Manifest, roots: List[str], types: set, output_root: str) -> None:
+    batch = []
+    for root in roots:
+        root = os.path.abspath(root)
+        for entry in walk_files(root, types, skip_dir=output_root):
+            stat = entry.stat(follow_symlinks=False)
+            batch.append((os.path.abspath(entry.path), root, stat.st_size, stat.st_mtime))
+            if len(batch) >= 10000:
+                manifest.add(batch)
+                batch = []
+    if batch:
+        manifest.add(batch)
+
+
+# --- Worker Process ---
+
+_worker_models = {}
+
+def _init_worker(use_ner: bool) -> None:
+    """Loads the models once per worker process rather than once per file."""
+    if use_ner:
+        from pii_analyzer import SpacyNer
+        _worker_models["spacy_ner"] = SpacyNer("en_core_web_sm")
+
+
+def output_path_for(path: str, root: str, output_root: str) -> str:
+    relative = os.path.relpath(path, root)
+    # Each input root is mirrored under its own directory name
+    target = os.path.join(output_root, os.path.basename(root.rstrip(os.sep)), relative)
+    # PDFs come out as sanitized plain text; every other type keeps its format
+    if file_type(path) == 'pdf':
+        target += ".sanitized.txt"
+    return target
+
+
+def sanitize_file(path: str, root: str, output_root: str) -> Dict:
+    """Sanitizes one file into the mirrored tree. Runs in a worker process."""
+    from pii_analyzer import analyze_and_sanitize_document, sanitize_docx
+    from image_pipeline import sanitize_image_file
+
+    start = time.perf_counter()
+    kind = file_type(path)
+    content_type = CONTENT_TYPES[kind]
+    target = output_path_for(path, root, output_root)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Write to a temporary name first so a crash never leaves a partial output
+    # behind; the extension is kept because image encoders are chosen by it
+    base, extension = os.path.splitext(target)
+    tmp_target = f"{base}.partial{extension}"
+
+    try:
+        if kind == 'docx':
+            pii_count = sanitize_docx(path, tmp_target)["pii_count"]
+        elif content_type.startswith('image/'):
+            outcome = sanitize_image_file(path, tmp_target, spacy_ner=_worker_models.get("spacy_ner"))
+            pii_count = len(outcome["pii_detected"])
+            if not outcome["redacted"]:
+                shutil.copyfile(path, tmp_target)
+        else:
+            with open(path, 'rb') as f:
+                # Unreadable files must fail rather than yield the error message as their "text"
+                results = analyze_and_sanitize_document(f.read(), content_type, strict=True)
+            pii_count = results["pii_count"]
+            sanitized_text = results["sanitized_text"] if results["original_text"].strip() else results["original_text"]
+            with open(tmp_target, 'w', encoding='utf-8') as f:
+                f.write(sanitized_text)
+        os.replace(tmp_target, target)
+        status, error = "done", None
+    except Exception as e:
+        if os.path.exists(tmp_target):
+            os.remove(tmp_target)
+        status, error, pii_count, target = "failed", f"{type(e).__name__}: {e}", None, None
+
+    return {"status": status, "output": target, "pii_count": pii_count, "error": error,
+            "duration": time.perf_counter() - start}
+
+
+# --- Progress Reporting ---
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s"
+
+
+class Progress:
+    def __init__(self, total_files: int, total_bytes: int, interval: float):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.files = self.bytes = self.failed = 0
+
+    def update(self, size: int, ok: bool) -> None:
+        self.files += 1
+        self.bytes += size
+        self.failed += not ok
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self) -> None:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        files_per_s = self.files / elapsed
+        mb_per_s = self.bytes / elapsed / (1024 * 1024)
+        # Estimate by bytes, since file sizes vary far more than file counts
+        remaining_bytes = self.total_bytes - self.bytes
+        eta = remaining_bytes / (self.bytes / elapsed) if self.bytes else float("nan")
+        eta_text = format_duration(eta) if eta == eta else "?"
+        print(f"📊 {self.files}/{self.total_files} files ({self.failed} failed) | "
+              f"{files_per_s:.1f} files/s, {mb_per_s:.2f} MB/s | elapsed {format_duration(elapsed)} | ETA {eta_text}",
+              flush=True)
+
+
+# --- Main ---
+
+def parse_types(value: str) -> set:
+    types = {t.strip().lower().lstrip('.') for t in value.split(',') if t.strip()}
+    unknown = types - CONTENT_TYPES.keys()
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unsupported file type(s): {', '.join(sorted(unknown))}")
+    return types
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Sanitize directory trees of documents and images offline.")
+    parser.add_argument("inputs", nargs="+", help="Directories to process")
+    parser.add_argument("-o", "--output", required=True, help="Root of the mirrored output tree")
+    parser.add_argument("--manifest", default=None, help="SQLite manifest path (default: <output>/manifest.sqlite)")
+    parser.add_argument("--types", type=parse_types, default=set(CONTENT_TYPES),
+                        help=f"Comma-separated file types to include (default: {','.join(sorted(CONTENT_TYPES))})")
+    parser.add_argument("--exclude-types", type=parse_types, default=set(), help="Comma-separated file types to skip")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--ner", action="store_true", help="Also run spaCy NER on images (slower)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry files that failed in an earlier run")
+    parser.add_argument("--rescan", action="store_true",
+                        help="Walk the inputs again even if the manifest already lists files")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="Seconds between progress reports")
+    args = parser.parse_args(argv)
+
+    output_root = os.path.abspath(args.output)
+    os.makedirs(output_root, exist_ok=True)
+    manifest = Manifest(args.manifest or os.path.join(output_root, "manifest.sqlite"))
+    types = args.types - args.exclude_types
+
+    # Walking millions of files is slow, so a resumed run reuses the listing unless asked to rescan
+    if args.rescan or not manifest.counts():
+        print("🔍 Discovering files...", flush=True)
+        discover(manifest, args.inputs, types, output_root)
+    if args.retry_failed:
+        manifest.reset_failed()
+
+    # Files of other types stay pending for a later run with a wider filter
+    counts = manifest.counts(types)
+    pending_files, pending_bytes = counts.get("pending", (0, 0))
+    print(f"🚀 {pending_files} files to process ({counts.get('done', (0, 0))[0]} already done, "
+          f"{counts.get('failed', (0, 0))[0]} failed earlier) with {args.workers} workers", flush=True)
+
+    progress = Progress(pending_files, pending_bytes, args.report_interval)
+    pending = manifest.pending(types)
+    in_flight = {}
+
+    def new_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.ner,))
+
+    def finish(path: str, size: int, result: Dict) -> None:
+        if result["status"] == "failed":
+            print(f"❌ {path}: {result['error']}", flush=True)
+        manifest.record(path, result)
+        progress.update(size, result["status"] == "done")
+
+    pool = new_pool()
+    try:
+        while True:
+            # Keep a bounded number of tasks queued instead of submitting millions at once
+            while len(in_flight) < args.workers * 2:
+                row = next(pending, None)
+                if row is None:
+                    break
+                path, root, size = row
+                in_flight[pool.submit(sanitize_file, path, root, output_root)] = (path, root, size)
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            crashed = []
+            for future in done:
+                path, root, size = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    crashed.append((path, root, size))
+                    continue
+                except Exception as e:
+                    result = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+                finish(path, size, result)
+
+            if crashed:
+                # A worker died (e.g. out of memory) and took the pool down with
+                # it; every task in the pool failed, but only one file caused it.
+                # Run those files again one at a time in fresh pools to find it.
+                crashed += in_flight.values()
+                in_flight.clear()
+                pool.shutdown(wait=False, cancel_futures=True)
+                print(f"⚠️ A worker crashed; re-running {len(crashed)} affected files one at a time", flush=True)
+                pool = new_pool()
+                for path, root, size in crashed:
+                    try:
+                        result = pool.submit(sanitize_file, path, root, output_root).result()
+                    except BrokenProcessPool:
+                        result = {"status": "failed", "error": "Worker process crashed (out of memory?)"}
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        pool = new_pool()
+                    except Exception as e:
+                        result = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+                    finish(path, size, result)
+    except KeyboardInterrupt:
+        print("\n⏸️ Interrupted; progress is saved. Run the same command again to resume.")
+        return 130
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        manifest.close()
+
+    progress.report()
+    print(f"✅ Finished. Outputs are in {output_root}")
+    return 1 if progress.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
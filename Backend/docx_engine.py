@@ -0,0 +1,206 @@
+import io
+import re
+import shutil
+import zipfile
+from array import array
+from bisect import bisect_right
+from typing import BinaryIO, Dict, Iterable, List, Tuple, Union
+from xml.parsers import expat
+from xml.sax.saxutils import escape
+
+# WordprocessingML namespace, as reported by expat with namespace_separator=' '
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main "
+# Parts that carry document text, in reading order (document body first)
+TEXT_PART_PATTERN = re.compile(r"word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$")
+READ_CHUNK_SIZE = 64 * 1024
+
+DocxSource = Union[bytes, str, BinaryIO]
+# (start, end, replacement) in offsets of the extracted text
+Replacement = Tuple[int, int, str]
+
+
+class DocxText:
+    """
+    Text extracted from a DOCX plus the location of every <w:t> run in the
+    archive. Run i covers text[doc_starts[i]:doc_ends[i]] and its escaped
+    content occupies bytes [byte_starts[i], byte_ends[i]) of part parts[i].
+    Offsets are kept in flat arrays so that documents with thousands of
+    tables don't allocate an object per run.
+    """
+    __slots__ = ('text', 'part_names', 'parts', 'doc_starts', 'doc_ends', 'byte_starts', 'byte_ends')
+
+    def __init__(self):
+        self.text = ""
+        self.part_names: List[str] = []
+        self.parts = array('i')
+        self.doc_starts = array('q')
+        self.doc_ends = array('q')
+        self.byte_starts = array('q')
+        self.byte_ends = array('q')
+
+
+class _PartParser:
+    """Incrementally parses one XML part and records its text runs."""
+    def __init__(self, result: DocxText, part_index: int, pieces: List[str], offset: int):
+        self.result = result
+        self.part_index = part_index
+        self.pieces = pieces
+        self.offset = offset
+        self.in_text = False
+        self.run_start = None
+        self.run_pieces: List[str] = []
+        self.parser = expat.ParserCreate(namespace_separator=' ')
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.characters
+
+    def feed(self, stream: BinaryIO) -> int:
+        while True:
+            chunk = stream.read(READ_CHUNK_SIZE)
+            self.parser.Parse(chunk, not chunk)
+            if not chunk:
+                return self.offset
+
+    def _append(self, text: str) -> None:
+        self.pieces.append(text)
+        self.offset += len(text)
+
+    def start(self, name: str, attrs) -> None:
+        if name == W_NS + "t":
+            self.in_text = True
+            self.run_start = None
+            self.run_pieces = []
+        elif name == W_NS + "tab":
+            self._append("\t")
+        elif name in (W_NS + "br", W_NS + "cr"):
+            self._append("\n")
+
+    def characters(self, data: str) -> None:
+        if self.in_text:
+            if self.run_start is None:
+                self.run_start = self.parser.CurrentByteIndex
+            self.run_pieces.append(data)
+
+    def end(self, name: str) -> None:
+        if name == W_NS + "t":
+            self.in_text = False
+            if self.run_start is None:
+                return
+            text = "".join(self.run_pieces)
+            result = self.result
+            result.parts.append(self.part_index)
+            result.doc_starts.append(self.offset)
+            result.doc_ends.append(self.offset + len(text))
+            result.byte_starts.append(self.run_start)
+            result.byte_ends.append(self.parser.CurrentByteIndex)
+            self._append(text)
+        elif name == W_NS + "p":
+            self._append("\n")
+
+
+def _open_archive(source: DocxSource) -> zipfile.ZipFile:
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    return zipfile.ZipFile(source)
+
+
+def _text_parts(archive: zipfile.ZipFile) -> List[str]:
+    names = [n for n in archive.namelist() if TEXT_PART_PATTERN.match(n)]
+    return sorted(names, key=lambda n: (n != "word/document.xml", n))
+
+
+def extract_docx(source: DocxSource) -> DocxText:
+    """
+    Streams the body, headers, footers, footnotes and endnotes of a DOCX
+    through an incremental XML parser. Paragraphs (including those in table
+    cells) end with a newline; parts are concatenated in reading order.
+    """
+    result = DocxText()
+    pieces: List[str] = []
+    offset = 0
+    with _open_archive(source) as archive:
+        for part_index, name in enumerate(_text_parts(archive)):
+            result.part_names.append(name)
+            with archive.open(name) as stream:
+                offset = _PartParser(result, part_index, pieces, offset).feed(stream)
+    result.text = "".join(pieces)
+    return result
+
+
+def extract_docx_text(source: DocxSource) -> str:
+    return extract_docx(source).text
+
+
+def _run_edits(docx_text: DocxText, replacements: Iterable[Replacement]) -> Dict[str, List[Tuple[int, int, bytes]]]:
+    """
+    Maps text replacements onto the runs they touch. A replacement that
+    spans several runs is written into the run holding its first character
+    (or the first run it touches); the covered text of the other runs is
+    removed. Returns, per part, sorted (byte_start, byte_end, new_bytes) edits.
+    """
+    run_changes: Dict[int, List[Tuple[int, int, str]]] = {}
+    doc_starts, doc_ends = docx_text.doc_starts, docx_text.doc_ends
+    for start, end, replacement in sorted(replacements):
+        i = bisect_right(doc_ends, start)
+        placed = False
+        while i < len(doc_starts) and doc_starts[i] < end:
+            local_start = max(start, doc_starts[i]) - doc_starts[i]
+            local_end = min(end, doc_ends[i]) - doc_starts[i]
+            run_changes.setdefault(i, []).append((local_start, local_end, "" if placed else replacement))
+            placed = True
+            i += 1
+
+    edits: Dict[str, List[Tuple[int, int, bytes]]] = {}
+    for i, changes in sorted(run_changes.items()):
+        original = docx_text.text[doc_starts[i]:doc_ends[i]]
+        pieces, last = [], 0
+        for local_start, local_end, replacement in changes:
+            pieces.append(original[last:local_start])
+            pieces.append(replacement)
+            last = local_end
+        pieces.append(original[last:])
+        part = docx_text.part_names[docx_text.parts[i]]
+        new_content = escape("".join(pieces)).encode("utf-8")
+        edits.setdefault(part, []).append((docx_text.byte_starts[i], docx_text.byte_ends[i], new_content))
+    return edits
+
+
+def _copy_exact(src: BinaryIO, dst: BinaryIO, size: int) -> None:
+    while size > 0:
+        chunk = src.read(min(size, READ_CHUNK_SIZE))
+        if not chunk:
+            raise ValueError("Unexpected end of DOCX part")
+        if dst is not None:
+            dst.write(chunk)
+        size -= len(chunk)
+
+
+def _new_entry(info: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    entry = zipfile.ZipInfo(info.filename, info.date_time)
+    entry.compress_type = info.compress_type
+    entry.external_attr = info.external_attr
+    entry.comment = info.comment
+    entry.file_size = info.file_size
+    return entry
+
+
+def write_sanitized_docx(source: DocxSource, docx_text: DocxText, replacements: Iterable[Replacement], output: Union[str, BinaryIO]) -> int:
+    """
+    Writes a copy of the DOCX with the given text replacements applied.
+    Only the bytes of the affected <w:t> runs are rewritten; the rest of each
+    part, and every other archive member, is streamed through unchanged.
+    Returns the number of runs that were rewritten.
+    """
+    edits = _run_edits(docx_text, replacements)
+    with _open_archive(source) as archive, zipfile.ZipFile(output, "w", allowZip64=True) as out:
+        for info in archive.infolist():
+            entry = _new_entry(info)
+            with archive.open(info) as src, out.open(entry, "w", force_zip64=info.file_size > 0x7FFFFFFF) as dst:
+                position = 0
+                for byte_start, byte_end, new_content in edits.get(info.filename, []):
+                    _copy_exact(src, dst, byte_start - position)
+                    _copy_exact(src, None, byte_end - byte_start)
+                    dst.write(new_content)
+                    position = byte_end
+                shutil.copyfileobj(src, dst, READ_CHUNK_SIZE)
+    return sum(len(part_edits) for part_edits in edits.values())
@@ -0,0 +1,271 @@
+from typing import Any, Dict, List, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageSequence, TiffImagePlugin
+
+from pii_analyzer import extract_tokens, detect_pii_regex, log_redaction, redact_boxes
+from ocr_tokens import OcrTokens
+from page_frame import PageFrame
+
+# --- Tiling Configuration ---
+# Tiles are views of the page frame and are OCR'd one at a time, so the
+# only per-tile allocations are tile-sized. The frame itself is still a
+# whole decoded page: Pillow can't decode part of a PNG or JPEG.
+# The overlap must be wider than the widest word so that every word lies
+# completely inside at least one tile. Word widths scale with the scan
+# resolution, so the overlap is derived from the image DPI.
+TILE_SIZE = 2048
+# Width of the longest token we expect to find (e.g. a long e-mail address)
+MAX_TOKEN_WIDTH_INCHES = 1.5
+# Assumed when the file doesn't record its resolution; errs on the wide side
+DEFAULT_DPI = 600
+# Words on lines from neighbouring tiles are joined into one line when the
+# lines overlap vertically by this fraction of their height...
+LINE_MERGE_MIN_OVERLAP = 0.5
+# ...and the horizontal gap between them is at most this many line heights
+LINE_MERGE_MAX_GAP = 3.0
+# Signature detection does not need full resolution; it runs on a
+# decimated view of the frame that is at most this many pixels wide/high.
+DETECTION_MAX_SIDE = 1600
+# Tesseract works best at about 300 DPI; pages scanned at twice that or more
+# are decoded at a reduced size for detection (see PageFrame._from_image)
+OCR_MAX_DPI = 300
+# Pages in other modes are converted to RGB before redaction (e.g. palette
+# and 1-bit images can't be blurred)
+REDACTABLE_MODES = ("RGB", "L")
+
+Box = Tuple[int, int, int, int]
+
+
+def tile_overlap(dpi: Optional[float], tile_size: int = TILE_SIZE) -> int:
+    """Overlap in pixels that fits the widest expected token at the given resolution."""
+    overlap = int(MAX_TOKEN_WIDTH_INCHES * (dpi or DEFAULT_DPI))
+    return min(overlap, tile_size // 2)
+
+
+def iter_tiles(width: int, height: int, tile_size: int = TILE_SIZE, overlap: int = None) -> Iterator[Tuple[Box, Box]]:
+    """
+    Yields (tile, core) boxes covering a width x height page. Tiles overlap by
+    `overlap` pixels; the core boxes do not overlap and together cover the
+    page exactly, so each word can be assigned to exactly one tile.
+    """
+    if overlap is None:
+        overlap = tile_overlap(None, tile_size)
+    step = max(tile_size - overlap, 1)
+    half = overlap // 2
+    xs = list(range(0, max(width - overlap, 1), step))
+    ys = list(range(0, max(height - overlap, 1), step))
+    for y in ys:
+        for x in xs:
+            tile = (x, y, min(x + tile_size, width), min(y + tile_size, height))
+            core = (
+                x + half if x > 0 else 0,
+                y + half if y > 0 else 0,
+                x + step + half if x != xs[-1] else width,
+                y + step + half if y != ys[-1] else height,
+            )
+            yield tile, core
+
+
+def _merge_tile_lines(tokens: OcrTokens, tiles: np.ndarray) -> np.ndarray:
+    """
+    Returns per-word line IDs where text lines cut by tile seams are joined:
+    lines from different tiles that overlap vertically and nearly touch
+    horizontally get the same ID.
+    """
+    line_ids, word_lines = np.unique(tokens.lines, return_inverse=True)
+    count = len(line_ids)
+    boxes = tokens.boxes.astype(np.int64)
+    # Extent and tile of every line
+    x1 = np.full(count, np.iinfo(np.int64).max)
+    y1 = np.full(count, np.iinfo(np.int64).max)
+    x2 = np.full(count, np.iinfo(np.int64).min)
+    y2 = np.full(count, np.iinfo(np.int64).min)
+    np.minimum.at(x1, word_lines, boxes[:, 0])
+    np.minimum.at(y1, word_lines, boxes[:, 1])
+    np.maximum.at(x2, word_lines, boxes[:, 2])
+    np.maximum.at(y2, word_lines, boxes[:, 3])
+    line_tiles = np.zeros(count, np.int64)
+    line_tiles[word_lines] = tiles
+
+    heights = np.maximum(y2 - y1, 1)
+    centres = (y1 + y2) // 2
+    by_centre = np.argsort(centres, kind='stable')
+    sorted_centres = centres[by_centre]
+
+    # Union-find over the lines that belong together. Candidates for line i
+    # are the lines whose vertical centre lies within line i's extent.
+    parent = list(range(count))
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for i in range(count):
+        lo, hi = np.searchsorted(sorted_centres, [y1[i], y2[i]], side='left')
+        for j in by_centre[lo:hi].tolist():
+            if j == i or line_tiles[j] == line_tiles[i]:
+                continue
+            overlap = min(y2[i], y2[j]) - max(y1[i], y1[j])
+            gap = max(x1[i], x1[j]) - min(x2[i], x2[j])
+            if (overlap >= LINE_MERGE_MIN_OVERLAP * min(heights[i], heights[j])
+                    and gap <= LINE_MERGE_MAX_GAP * max(heights[i], heights[j])):
+                parent[root(i)] = root(j)
+    roots = np.array([root(i) for i in range(count)], np.int64)
+    return roots[word_lines]
+
+
+def reading_order(tokens: OcrTokens, tiles: np.ndarray) -> OcrTokens:
+    """
+    Rebuilds the token table of a tiled page in reading order: lines top to
+    bottom (joined across tile seams), words left to right within a line,
+    so that text spanning a seam is contiguous for the PII patterns.
+    """
+    if not len(tokens):
+        return tokens
+    lines = _merge_tile_lines(tokens, tiles)
+    # Lines are ordered by the top of their highest word
+    line_ids, word_lines = np.unique(lines, return_inverse=True)
+    tops = np.full(len(line_ids), np.iinfo(np.int64).max)
+    np.minimum.at(tops, word_lines, tokens.boxes[:, 1].astype(np.int64))
+    line_rank = np.argsort(np.argsort(tops, kind='stable'), kind='stable')[word_lines]
+    order = np.lexsort((tokens.boxes[:, 0], line_rank))
+    return tokens.take(order, line_rank)
+
+
+def extract_tokens_tiled(frame: PageFrame, tile_size: int = TILE_SIZE, overlap: Optional[int] = None) -> OcrTokens:
+    """
+    Runs OCR on overlapping tiles of a page and maps the word boxes back to
+    page coordinates. A word is kept only by the tile whose core box contains
+    its centre, so words in the overlap are not reported twice. The overlap
+    defaults to one that fits the widest expected word at the frame's DPI.
+    """
+    width, height = frame.size
+    if width <= tile_size and height <= tile_size:
+        return extract_tokens(frame.pixels)
+    if overlap is None:
+        overlap = tile_overlap(frame.dpi, tile_size)
+
+    parts = []
+    for (tx, ty, tx2, ty2), (cx, cy, cx2, cy2) in iter_tiles(width, height, tile_size, overlap):
+        tokens = extract_tokens(frame.view((tx, ty, tx2, ty2))).shifted(tx, ty)
+        centre_x = (tokens.boxes[:, 0] + tokens.boxes[:, 2]) / 2
+        centre_y = (tokens.boxes[:, 1] + tokens.boxes[:, 3]) / 2
+        in_core = (centre_x >= cx) & (centre_x < cx2) & (centre_y >= cy) & (centre_y < cy2)
+        parts.append(tokens if in_core.all() else tokens.select(in_core))
+    tiles = np.repeat(np.arange(len(parts)), [len(p) for p in parts])
+    return reading_order(OcrTokens.concat(parts), tiles)
+
+
+def detect_signatures_reduced(detector, frame: PageFrame, max_side: int = DETECTION_MAX_SIDE) -> List[Box]:
+    """Runs signature detection on a downscaled view of the page and maps the boxes back to frame coordinates."""
+    pixels, factor = frame.downscaled(max_side)
+    boxes = detector.detect_signatures(pixels) or []
+    return [tuple(int(round(v * factor)) for v in box[:4]) for box in boxes]
+
+
+def sanitize_image_file(filepath: str, output_path: str, spacy_ner=None, signature_detector=None, method: str = 'blackbox') -> Dict[str, Any]:
+    """
+    Runs OCR, PII detection (regex and NER) and signature detection on every
+    page of an image file and, if anything sensitive was found, writes a
+    redacted copy with all pages to output_path. Returns the detected PII
+    (with a "page" index for multi-page files) and whether a copy was written.
+    """
+    # Each page is decoded once into a shared buffer for OCR and signature
+    # detection, at reduced size for high-resolution scans. Pages are scanned
+    # one at a time and only their boxes to redact are kept; the output is
+    # written from a fresh full-size decode, again one page at a time.
+    page_pii = []
+    page_boxes = []
+    for frame in PageFrame.iter_file(filepath, OCR_MAX_DPI):
+        pii, boxes_to_redact = _detect_frame(frame, spacy_ner, signature_detector)
+        page_pii.append(pii)
+        page_boxes.append(boxes_to_redact)
+        # Released before the next page is decoded
+        del frame
+
+    pii_found = []
+    for page, pii in enumerate(page_pii):
+        if len(page_pii) > 1:
+            for item in pii:
+                item["page"] = page
+        pii_found.extend(pii)
+
+    redacted = any(page_boxes)
+    if redacted:
+        write_redacted(filepath, output_path, page_boxes, method)
+    return {"pii_detected": pii_found, "redacted": redacted}
+
+
+def write_redacted(filepath: str, output_path: str, page_boxes: Sequence[List[Box]], method: str = 'blackbox') -> None:
+    """
+    Decodes the pages of an image file again at full resolution, redacts the
+    given boxes (in page coordinates, one list per page) and writes the result
+    to output_path. Pillow's encoders need a whole page in memory, so one
+    full-size page is decoded at a time. Multi-page formats other than TIFF
+    are the exception: Pillow's writers for them take every page at once.
+    """
+    with Image.open(filepath) as image:
+        pages = _redacted_pages(image, page_boxes, method)
+        if len(page_boxes) == 1:
+            next(pages).save(output_path)
+        elif image.format == "TIFF":
+            # Each page is written, then replaced by the next one
+            with TiffImagePlugin.AppendingTiffWriter(output_path, new=True) as tiff:
+                for page in pages:
+                    page.save(tiff, format="TIFF")
+                    tiff.newFrame()
+                    del page
+        else:
+            first, *rest = (page.copy() for page in pages)
+            first.save(output_path, save_all=True, append_images=rest)
+
+
+def _redacted_pages(image: Image.Image, page_boxes: Sequence[List[Box]], method: str) -> Iterator[Image.Image]:
+    """
+    Yields the pages of an opened image file with their boxes redacted. A
+    page may be redacted in place, so it is only valid until the next one
+    is requested.
+    """
+    for page, boxes in zip(ImageSequence.Iterator(image), page_boxes):
+        # Loaded first: drawing on an unloaded image works on a copy
+        page.load()
+        if page.mode not in REDACTABLE_MODES:
+            page = page.convert("RGB")
+        redact_boxes(page, boxes, method=method)
+        yield page
+
+
+def _detect_frame(frame: PageFrame, spacy_ner=None, signature_detector=None) -> Tuple[List[Dict[str, Any]], List[Box]]:
+    """Returns the PII found on one page and the boxes to redact, in page coordinates."""
+    # 1. OCR to get text and bounding boxes
+    tokens = extract_tokens_tiled(frame)
+    full_text = tokens.text
+
+    boxes_to_redact = []
+    pii_found = []
+
+    # 2. Detect PII (Regex and NER) and map to boxes via character offsets
+    for span in detect_pii_regex(full_text):
+        pii_found.append({"text": span.text, "type": span.type})
+        for box in tokens.span_boxes(span.start, span.end):
+            box = frame.to_page_box(box)
+            boxes_to_redact.append(box)
+            log_redaction("regex_pii", span.text, box)
+
+    if spacy_ner is not None:
+        for entity in spacy_ner.detect_pii(full_text):
+            pii_found.append({"text": entity['text'], "type": entity['type']})
+            for box in tokens.span_boxes(entity['start'], entity['end']):
+                box = frame.to_page_box(box)
+                boxes_to_redact.append(box)
+                log_redaction("ner_pii", entity['text'], box)
+
+    # 3. Detect Signatures
+    if signature_detector is not None:
+        for box in detect_signatures_reduced(signature_detector, frame):
+            box = frame.to_page_box(box)
+            boxes_to_redact.append(box)
+            log_redaction("signature", "signature detected", box)
+
+    return pii_found, boxes_to_redact
@@ -1,8 +1,13 @@
+import json
 import os
 import sys
+import tempfile
 from io import BytesIO
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from typing import Optional
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Header, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 # --- Setup Python Path for relative imports ---
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -10,12 +15,20 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # --- Import your project's custom modules ---
 try:
     # MODIFIED: Import the single orchestrator function
-    from pii_analyzer import analyze_and_sanitize_document
+    from pii_analyzer import (NoTextExtracted, analyze_and_sanitize_document, analyze_document_spans,
+                              iter_spliced, sanitize_docx)
 except ImportError as e:
     print(f"❌ Critical Import Error: {e}")
     print("👉 Please ensure 'pii_analyzer.py' with the 'analyze_and_sanitize_document' function exists.")
     sys.exit(1)
 
+from page_cache import PageCache
+from admission import AdmissionController, Overloaded, Ticket, count_pdf_pages, estimate_cost, job_kind
+from profiling import (
+    PROFILE_HEADER, REQUEST_ID_HEADER,
+    maybe_profile, new_request_id, profile_store, profiling_authorized
+)
+
 # --- Initialize FastAPI App ---
 app = FastAPI(
     title="SanitiAI - PII Detection Pipeline",
@@ -31,6 +44,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Stored page results of document lineages expire (see page_cache.py)
+PageCache().start_sweeper()
+
+# Processing runs in the thread pool, behind the admission controller's lanes,
+# so long documents neither block the event loop nor starve small ones.
+admission = AdmissionController()
+
+def _admit(kind: str, size_bytes: int, pages: int = 1) -> Ticket:
+    try:
+        return admission.admit(estimate_cost(kind, size_bytes, pages))
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def _upload_size(file: UploadFile) -> int:
+    if file.size is not None:
+        return file.size
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+def _span_response(mode: str, analysis: dict, filename: Optional[str], request_id: str):
+    """
+    Builds the compact /analyze/ responses from analyze_document_spans():
+    "spans" returns the replacements as JSON, "stream" streams the sanitized
+    text and "diff" streams one JSON replacement per line (NDJSON) for
+    clients that already hold the original text.
+    """
+    text, spans = analysis["text"], analysis["spans"]
+    headers = {
+        REQUEST_ID_HEADER: request_id,
+        "X-PII-Count": str(analysis["pii_count"]),
+        "X-Replacements": str(len(spans)),
+        "X-Text-Length": str(len(text)),
+        "X-Scan-Complete": str(analysis["scan"]["complete"]).lower()
+    }
+    replacements = ({"start": s.start, "end": s.end, "type": s.type, "replacement": s.replacement} for s in spans)
+
+    if mode == "stream":
+        return StreamingResponse(iter_spliced(text, spans), media_type="text/plain; charset=utf-8", headers=headers)
+    if mode == "diff":
+        return StreamingResponse((json.dumps(r) + "\n" for r in replacements), media_type="application/x-ndjson", headers=headers)
+    return JSONResponse({
+        "filename": filename,
+        "pii_count": analysis["pii_count"],
+        "text_length": len(text),
+        "replacements": list(replacements),
+        "scan": analysis["scan"]
+    }, headers=headers)
+
 # --- API Endpoints ---
 
 @app.get("/", summary="API Health Check")
@@ -40,21 +103,119 @@ async def root():
 
 # MODIFIED: Replaced the background task endpoint with the new synchronous version
 @app.post("/analyze/", summary="Analyze and Sanitize a Document")
-async def start_analysis(file: UploadFile = File(...)):
+async def start_analysis(
+    response: Response,
+    file: UploadFile = File(...),
+    lineage_id: Optional[str] = Form(None),
+    response_mode: str = Query("full", pattern="^(full|spans|stream|diff)$"),
+    profile: Optional[str] = Query(None),
+    profile_allocations: bool = Query(False),
+    profile_header: Optional[str] = Header(None, alias=PROFILE_HEADER)
+):
     """
     Accepts a document, performs analysis and sanitization, 
     and returns the complete results in a single response.
+    Pass the same lineage_id for every revision of a document to only
+    re-process the pages that changed since the previous revision.
+    Authorized callers can send the profiling token (header or ?profile=)
+    to record a profile, retrievable from /profiles/{request_id}; add
+    profile_allocations=true for allocation stats (slows concurrent requests).
+    Responds 429 with Retry-After when the server is too busy.
+
+    For large documents, response_mode avoids sending the text twice:
+    "spans" returns only the replacements (offsets, type, replacement),
+    "stream" streams the sanitized text as a chunked text/plain body and
+    "diff" streams the replacements as NDJSON. A document without any
+    extractable text gets a 422 in these modes.
     """
+    if lineage_id and response_mode != "full":
+        raise HTTPException(status_code=400, detail="lineage_id is only supported with response_mode=full")
+    file_content = await file.read()
+    kind = job_kind(file.content_type, os.path.splitext(file.filename or "")[1])
+    pages = count_pdf_pages(file_content, len(file_content)) if kind == "pdf" else 1
+    ticket = _admit(kind, len(file_content), pages)
+
     try:
-        file_content = await file.read()
+        request_id = new_request_id()
+        response.headers[REQUEST_ID_HEADER] = request_id
+
+        def run_analysis():
+            # Call the single pipeline function from pii_analyzer.py
+            with ticket, maybe_profile(profile_header or profile, request_id, "/analyze/", profile_allocations):
+                if response_mode != "full":
+                    return analyze_document_spans(file_content, file.content_type)
+                return analyze_and_sanitize_document(file_content, file.content_type, lineage_id)
 
-        # Call the single pipeline function from pii_analyzer.py
-        analysis_results = analyze_and_sanitize_document(file_content, file.content_type)
+        analysis_results = await run_in_threadpool(run_analysis)
+        if response_mode != "full":
+            return _span_response(response_mode, analysis_results, file.filename, request_id)
         
         # Add the filename and return the final results
         analysis_results["filename"] = file.filename
         return analysis_results
         
+    except NoTextExtracted as e:
+        # "full" reports this in sanitized_text; the compact modes have no place for it
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         # Catch any errors during the process
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    finally:
+        # Gives back the queue place if the job never got to run
+        ticket.cancel()
+
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+@app.post("/sanitize/docx/", summary="Return a Sanitized Copy of a DOCX")
+async def sanitize_docx_file(file: UploadFile = File(...)):
+    """
+    Accepts a .docx file and returns the same document with numerical PII
+    replaced by dummy values. Only the affected text runs are rewritten, so
+    formatting, tables, headers and footers are preserved.
+    """
+    ticket = _admit(job_kind(file.content_type, ".docx"), _upload_size(file))
+
+    try:
+        # Large outputs spill to disk instead of being held in memory
+        output = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+
+        def run_sanitize():
+            with ticket:
+                return sanitize_docx(file.file, output)
+
+        summary = await run_in_threadpool(run_sanitize)
+        output.seek(0)
+
+        def iter_output():
+            with output:
+                yield from iter(lambda: output.read(64 * 1024), b"")
+
+        return StreamingResponse(iter_output(), media_type=DOCX_CONTENT_TYPE, headers={
+            "Content-Disposition": f'attachment; filename="sanitized_{os.path.basename(file.filename or "document.docx")}"',
+            "X-PII-Count": str(summary["pii_count"]),
+            "X-Replacements": str(summary["replacements"])
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    finally:
+        ticket.cancel()
+
+@app.get("/profiles/{request_id}", summary="Fetch a Request Profile")
+async def get_profile(
+    request_id: str,
+    format: str = Query("json", pattern="^(json|folded)$"),
+    profile: Optional[str] = Query(None),
+    profile_header: Optional[str] = Header(None, alias=PROFILE_HEADER)
+):
+    """
+    Returns the sampled stacks (and allocation stats, if requested) of a profiled
+    request. format=folded returns the stacks for flamegraph.pl or speedscope.
+    """
+    if not profiling_authorized(profile_header or profile):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    recorded = profile_store.get(request_id)
+    if recorded is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return PlainTextResponse(recorded["folded"])
+    return recorded
@@ -1,4 +1,4 @@
-import re
+from regex_engine import compile_patterns, findall_value, scan
 
 # Regex patterns for common PII
 PII_PATTERNS = {
@@ -7,11 +7,11 @@ PII_PATTERNS = {
     'ssn': r'\b\d{3}-\d{2}-\d{4}\b',
     'aadhaar': r'\b\d{4}\s\d{4}\s\d{4}\b'
 }
+COMPILED_PII_PATTERNS = compile_patterns(PII_PATTERNS)
 
-def detect_pii_regex(text):
+def detect_pii_regex(text, budget=None):
     
     matches = []
-    for label, pattern in PII_PATTERNS.items():
-        found = re.findall(pattern, text)
-        matches.extend(found)
+    for label, found in scan(COMPILED_PII_PATTERNS, text, budget).matches.items():
+        matches.extend(findall_value(m) for m in found)
     return matches
@@ -0,0 +1,190 @@
+import json
+from typing import Any, Dict, List, Sequence, Tuple
+import numpy as np
+
+
+class Span:
+    """
+    A detected PII span with character offsets into a text buffer and,
+    for spans that get sanitized, the text that replaces it.
+    """
+    __slots__ = ('type', 'text', 'start', 'end', 'confidence', 'replacement')
+
+    def __init__(self, type: str, text: str, start: int, end: int, confidence: float = 0.9, replacement: str = None):
+        self.type = type
+        self.text = text
+        self.start = start
+        self.end = end
+        self.confidence = confidence
+        self.replacement = replacement
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {'type': self.type, 'text': self.text, 'start': self.start,
+                'end': self.end, 'confidence': self.confidence}
+        if self.replacement is not None:
+            data['replacement'] = self.replacement
+        return data
+
+    def __repr__(self) -> str:
+        return f"Span({self.type!r}, {self.text!r}, {self.start}, {self.end})"
+
+
+class Token:
+    """A lightweight view of one OCR word inside an OcrTokens table."""
+    __slots__ = ('text', 'box', 'confidence', 'start', 'end')
+
+    def __init__(self, text: str, box: Tuple[int, int, int, int], confidence: float, start: int, end: int):
+        self.text = text
+        self.box = box
+        self.confidence = confidence
+        self.start = start
+        self.end = end
+
+
+class OcrTokens:
+    """
+    Struct-of-arrays container for the words of one OCR'd page.
+
+    All words live in a single text buffer, separated by single spaces, and
+    word i occupies text[starts[i]:ends[i]]. Boxes are (x1, y1, x2, y2) rows
+    of an int32 array, and `lines` holds an ID per word that is shared by
+    words on the same text line. Filtering, span lookups and box merging
+    are done on these arrays rather than on per-word Python objects.
+    """
+    __slots__ = ('text', 'boxes', 'confidences', 'starts', 'ends', 'lines')
+
+    def __init__(self, text: str, boxes: np.ndarray, confidences: np.ndarray,
+                 starts: np.ndarray, ends: np.ndarray, lines: np.ndarray):
+        self.text = text
+        self.boxes = boxes
+        self.confidences = confidences
+        self.starts = starts
+        self.ends = ends
+        self.lines = lines
+
+    @classmethod
+    def empty(cls) -> "OcrTokens":
+        return cls.from_words([], np.zeros((0, 4), np.int32), np.zeros(0, np.float32), np.zeros(0, np.int64))
+
+    @classmethod
+    def from_words(cls, words: Sequence[str], boxes: np.ndarray, confidences: np.ndarray, lines: np.ndarray) -> "OcrTokens":
+        """Builds the text buffer and character offsets for a list of words."""
+        lengths = np.fromiter((len(w) for w in words), dtype=np.int64, count=len(words))
+        ends = np.cumsum(lengths + 1) - 1
+        starts = ends - lengths
+        return cls(" ".join(words), np.asarray(boxes, np.int32).reshape(-1, 4),
+                   np.asarray(confidences, np.float32), starts, ends, np.asarray(lines, np.int64))
+
+    @classmethod
+    def from_tesseract(cls, data: Dict[str, list], min_conf: float = 60) -> "OcrTokens":
+        """Converts pytesseract.image_to_data(..., output_type=DICT) output, dropping low-confidence and empty words."""
+        words = np.asarray(data['text'], dtype=object)
+        if not len(words):
+            return cls.empty()
+        conf = np.asarray(data['conf'], dtype=np.float32)
+        keep = (conf > min_conf) & (np.char.str_len(np.char.strip(words.astype(str))) > 0)
+        left = np.asarray(data['left'], np.int32)[keep]
+        top = np.asarray(data['top'], np.int32)[keep]
+        boxes = np.stack([left, top, left + np.asarray(data['width'], np.int32)[keep],
+                          top + np.asarray(data['height'], np.int32)[keep]], axis=1)
+        # block, paragraph and line numbers together identify a text line
+        if 'line_num' in data and keep.any():
+            line_keys = np.stack([np.asarray(data[k], np.int64)[keep] for k in ('block_num', 'par_num', 'line_num')], axis=1)
+            lines = np.unique(line_keys, axis=0, return_inverse=True)[1].reshape(-1)
+        else:
+            lines = np.zeros(int(keep.sum()), np.int64)
+        return cls.from_words(words[keep].tolist(), boxes, conf[keep], lines)
+
+    @classmethod
+    def concat(cls, parts: Sequence["OcrTokens"]) -> "OcrTokens":
+        """Joins several token tables (e.g. OCR tiles) into one buffer, keeping line IDs distinct."""
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls.empty()
+        text = " ".join(p.text for p in parts)
+        offsets = np.cumsum([0] + [len(p.text) + 1 for p in parts[:-1]])
+        line_offsets = np.cumsum([0] + [int(p.lines.max()) + 1 for p in parts[:-1]])
+        return cls(text,
+                   np.concatenate([p.boxes for p in parts]),
+                   np.concatenate([p.confidences for p in parts]),
+                   np.concatenate([p.starts + o for p, o in zip(parts, offsets)]),
+                   np.concatenate([p.ends + o for p, o in zip(parts, offsets)]),
+                   np.concatenate([p.lines + o for p, o in zip(parts, line_offsets)]))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, i: int) -> Token:
+        start, end = int(self.starts[i]), int(self.ends[i])
+        return Token(self.text[start:end], tuple(self.boxes[i].tolist()), float(self.confidences[i]), start, end)
+
+    def words(self) -> List[str]:
+        return [self.text[s:e] for s, e in zip(self.starts.tolist(), self.ends.tolist())]
+
+    def select(self, mask: np.ndarray) -> "OcrTokens":
+        """Returns a new table holding only the words where mask is True."""
+        words = [w for w, keep in zip(self.words(), mask.tolist()) if keep]
+        return OcrTokens.from_words(words, self.boxes[mask], self.confidences[mask], self.lines[mask])
+
+    def take(self, indices: np.ndarray, lines: np.ndarray = None) -> "OcrTokens":
+        """Returns a new table holding the words at `indices` in that order, optionally with new per-word line IDs."""
+        words = self.words()
+        lines = self.lines if lines is None else lines
+        return OcrTokens.from_words([words[i] for i in indices.tolist()], self.boxes[indices],
+                                    self.confidences[indices], lines[indices])
+
+    def filter(self, min_conf: float) -> "OcrTokens":
+        """Drops words whose OCR confidence is not above min_conf."""
+        return self.select(self.confidences > min_conf)
+
+    def shifted(self, dx: int, dy: int) -> "OcrTokens":
+        """Returns the same words with their boxes translated by (dx, dy)."""
+        return OcrTokens(self.text, self.boxes + np.array([dx, dy, dx, dy], np.int32),
+                         self.confidences, self.starts, self.ends, self.lines)
+
+    def token_range(self, start: int, end: int) -> Tuple[int, int]:
+        """Returns the [first, last) indices of the words overlapping text[start:end]."""
+        first = int(np.searchsorted(self.ends, start, side='right'))
+        last = int(np.searchsorted(self.starts, end, side='left'))
+        return first, max(first, last)
+
+    def span_boxes(self, start: int, end: int) -> List[Tuple[int, int, int, int]]:
+        """
+        Returns the boxes covering text[start:end], merged into one box per
+        text line so that spans that wrap lines don't black out the gap.
+        """
+        first, last = self.token_range(start, end)
+        if first == last:
+            return []
+        return [tuple(box) for box in merge_boxes(self.boxes[first:last], self.lines[first:last]).tolist()]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'text': self.text,
+            'boxes': self.boxes.tolist(),
+            'confidences': self.confidences.tolist(),
+            'starts': self.starts.tolist(),
+            'ends': self.ends.tolist(),
+            'lines': self.lines.tolist()
+        })
+
+    @classmethod
+    def from_json(cls, payload: str) -> "OcrTokens":
+        data = json.loads(payload)
+        return cls(data['text'], np.asarray(data['boxes'], np.int32).reshape(-1, 4),
+                   np.asarray(data['confidences'], np.float32), np.asarray(data['starts'], np.int64),
+                   np.asarray(data['ends'], np.int64), np.asarray(data['lines'], np.int64))
+
+
+def merge_boxes(boxes: np.ndarray, groups: np.ndarray = None) -> np.ndarray:
+    """Returns the bounding box of each group of boxes (or of all boxes if no groups are given)."""
+    boxes = np.asarray(boxes, np.int32).reshape(-1, 4)
+    if groups is None:
+        groups = np.zeros(len(boxes), np.int64)
+    order = np.argsort(groups, kind='stable')
+    boxes, groups = boxes[order], np.asarray(groups)[order]
+    heads = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]]) if len(groups) else np.zeros(0, np.int64)
+    if not len(heads):
+        return np.zeros((0, 4), np.int32)
+    return np.concatenate([np.minimum.reduceat(boxes[:, :2], heads),
+                           np.maximum.reduceat(boxes[:, 2:], heads)], axis=1)
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from storage import evict_files, run_sweeper
+
+# Directory that holds one JSON file per document lineage
+PAGE_CACHE_FOLDER = "page_cache"
+# Lineages not used for this long are deleted; records hold unsanitized text
+PAGE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+# Once the cache grows past this, the least recently used lineages are deleted
+PAGE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def fingerprint_bytes(*chunks: bytes) -> str:
+    """Returns a stable content hash for one page (or any sequence of byte chunks)."""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(len(chunk).to_bytes(8, "big"))
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PageCache:
+    """
+    Stores per-page extraction and detection results keyed by a document
+    lineage ID, so that a new revision of a document only needs its changed
+    pages processed again.
+
+    Each lineage is saved as:
+        {"settings": <str>, "pages": {<fingerprint>: <page record>}}
+    Page records are looked up by fingerprint rather than page number, so
+    inserted, removed or reordered pages still reuse their stored results.
+    Records contain extracted text and PII, so sweep() deletes lineages not
+    used within `ttl_seconds` and keeps the cache under `max_bytes`.
+    """
+    def __init__(self, root: str = PAGE_CACHE_FOLDER, ttl_seconds: Optional[float] = PAGE_CACHE_TTL_SECONDS,
+                 max_bytes: Optional[int] = PAGE_CACHE_MAX_BYTES):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, lineage_id: str) -> str:
+        # Hash the lineage ID so arbitrary client-supplied IDs are safe file names
+        name = hashlib.sha256(lineage_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, f"{name}.json")
+
+    def load(self, lineage_id: str, settings: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the stored page records for a lineage. Records produced with
+        different settings (e.g. other dummy replacement values) are discarded.
+        """
+        path = self._path(lineage_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # The modification time doubles as the last access time for sweep()
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        if data.get("settings") != settings:
+            return {}
+        return data.get("pages", {})
+
+    def save(self, lineage_id: str, settings: str, pages: Dict[str, Dict[str, Any]]) -> None:
+        """Replaces the stored records of a lineage with the pages of its latest revision."""
+        path = self._path(lineage_id)
+        # A unique temp file per writer, so concurrent revisions of a lineage don't collide
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"settings": settings, "pages": pages}, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def sweep(self, now: Optional[float] = None) -> Tuple[int, int]:
+        """Applies the TTL and size quota. Returns (files removed, bytes freed)."""
+        now = time.time() if now is None else now
+        lineages = [entry for entry in os.scandir(self.root) if entry.name.endswith(".json")]
+        removed, freed = evict_files(lineages, self.ttl_seconds, self.max_bytes, now)
+        # Temp files left behind by writers that crashed
+        stale = [entry for entry in os.scandir(self.root) if entry.name.endswith(".tmp")]
+        stale_removed, stale_freed = evict_files(stale, 3600, None, now)
+        return removed + stale_removed, freed + stale_freed
+
+    def start_sweeper(self, interval_seconds: float = 600) -> threading.Thread:
+        """Runs sweep() every interval_seconds on a daemon thread."""
+        return run_sweeper(self.root, self.sweep, interval_seconds)
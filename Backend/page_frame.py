@@ -0,0 +1,144 @@
+from typing import Dict, Iterator, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+Box = Tuple[int, int, int, int]
+
+# Pillow's decompression-bomb limit (it warns above it and refuses images
+# twice as large) defaults to ~89 megapixels, but real scans are far bigger:
+# a 600-DPI A0 sheet is about 558 megapixels.
+MAX_PAGE_PIXELS = 1_000_000_000
+Image.MAX_IMAGE_PIXELS = MAX_PAGE_PIXELS
+# Decoded pages are copied into the frame buffer this many rows at a time,
+# so the only temporary next to Pillow's own bitmap is one strip
+COPY_STRIP_ROWS = 256
+# Image.reduce() averages pixel values, which is meaningless for palette images
+REDUCIBLE_MODES = ("RGB", "RGBA", "L")
+
+
+def image_dpi(image: Image.Image) -> Optional[float]:
+    """The horizontal resolution recorded in an image file, if any."""
+    dpi = image.info.get("dpi")
+    return float(dpi[0]) if dpi and dpi[0] else None
+
+
+def page_count(filepath: str) -> int:
+    """Number of pages (frames) in an image file."""
+    with Image.open(filepath) as image:
+        return getattr(image, "n_frames", 1)
+
+
+class PageFrame:
+    """
+    A page image decoded once into a single contiguous H x W x 3 uint8 buffer.
+
+    Consumers get views of that buffer instead of their own copies: tiles and
+    downscaled derivatives are NumPy slices. Derivatives are cached on the
+    frame; the grayscale one is a copy. A page scanned at a higher resolution
+    than needed may be decoded at 1/`scale` of its size; multiply frame
+    coordinates by `scale` to get page coordinates. `dpi` is the resolution
+    of the frame, if the file records one.
+    """
+    def __init__(self, pixels: np.ndarray, dpi: Optional[float] = None, scale: int = 1):
+        if pixels.ndim != 3 or pixels.shape[2] != 3 or pixels.dtype != np.uint8:
+            raise ValueError("PageFrame expects an H x W x 3 uint8 array")
+        self.pixels = np.ascontiguousarray(pixels)
+        self.dpi = dpi
+        self.scale = scale
+        self._gray = None
+        self._downscaled: Dict[int, np.ndarray] = {}
+
+    @classmethod
+    def _from_image(cls, image: Image.Image, max_dpi: Optional[float] = None) -> "PageFrame":
+        """
+        Decodes an opened page. If it records a resolution of at least twice
+        max_dpi, it is decoded at 1/scale size: JPEGs are scaled by the decoder
+        itself (draft mode), other formats are reduced right after decoding.
+        """
+        dpi = image_dpi(image)
+        # PNG stores resolution per metre, so 600 DPI reads back as 599.9988
+        scale = max(1, int(round(dpi) // max_dpi)) if dpi and max_dpi else 1
+        if scale > 1:
+            if image.format == "JPEG":
+                full_width = image.width
+                image.draft(image.mode, (-(-image.width // scale), -(-image.height // scale)))
+                decoded = max(1, round(full_width / image.width))
+            else:
+                decoded = 1
+            remaining = scale // decoded
+            if remaining > 1 and image.mode in REDUCIBLE_MODES:
+                image = image.reduce(remaining)
+            else:
+                remaining = 1
+            scale = decoded * remaining
+
+        # Copying strip by strip avoids a second full-size bitmap: np.array(image)
+        # and convert() both copy the whole page while the decoded one is alive
+        pixels = np.empty((image.height, image.width, 3), np.uint8)
+        for top in range(0, image.height, COPY_STRIP_ROWS):
+            strip = image.crop((0, top, image.width, min(top + COPY_STRIP_ROWS, image.height)))
+            if strip.mode != "RGB":
+                strip = strip.convert("RGB")
+            pixels[top:top + strip.height] = np.asarray(strip)
+        return cls(pixels, dpi / scale if dpi else None, scale)
+
+    @classmethod
+    def from_file(cls, filepath: str, max_dpi: Optional[float] = None, page: int = 0) -> "PageFrame":
+        """Decodes one page (by default the first, usually only one) of an image file into a new frame."""
+        with Image.open(filepath) as image:
+            image.seek(page)
+            return cls._from_image(image, max_dpi)
+
+    @classmethod
+    def iter_file(cls, filepath: str, max_dpi: Optional[float] = None) -> Iterator["PageFrame"]:
+        """
+        Decodes every page of an image file (e.g. a multi-page TIFF), one frame
+        at a time. The file is reopened for every page, so Pillow's bitmap of a
+        page is released as soon as its frame is built.
+        """
+        for page in range(page_count(filepath)):
+            yield cls.from_file(filepath, max_dpi, page)
+
+    @property
+    def width(self) -> int:
+        return self.pixels.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.pixels.shape[0]
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+    def view(self, box: Box) -> np.ndarray:
+        """Returns a zero-copy view of the (x1, y1, x2, y2) region."""
+        x1, y1, x2, y2 = box
+        return self.pixels[y1:y2, x1:x2]
+
+    @property
+    def gray(self) -> np.ndarray:
+        """Cached 8-bit grayscale derivative (ITU-R 601 luma)."""
+        if self._gray is None:
+            r, g, b = (self.pixels[..., i].astype(np.uint16) for i in range(3))
+            self._gray = ((r * 77 + g * 150 + b * 29) >> 8).astype(np.uint8)
+        return self._gray
+
+    def downscaled(self, max_side: int) -> Tuple[np.ndarray, int]:
+        """
+        Returns a strided view that is at most max_side pixels on its longest
+        side (nearest-neighbour decimation, no copy) and the integer factor
+        that maps its coordinates back to the frame.
+        """
+        factor = max(1, -(-max(self.width, self.height) // max_side))
+        if factor not in self._downscaled:
+            self._downscaled[factor] = self.pixels[::factor, ::factor]
+        return self._downscaled[factor], factor
+
+    def to_page_box(self, box: Box) -> Box:
+        """Maps a box in frame coordinates to page coordinates."""
+        return tuple(int(v) * self.scale for v in box[:4])
+
+    def to_image(self, box: Box = None) -> Image.Image:
+        """Returns a PIL copy of the page or of one region, for APIs that need a PIL image."""
+        return Image.fromarray(self.pixels if box is None else self.view(box))
@@ -1,10 +1,16 @@
-import re
 import spacy
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Tuple, Union
 import logging
+import threading
+import numpy as np
 from PIL import Image, ImageDraw, ImageFilter
 import json
 import os
+from bisect import bisect_right
+
+from page_cache import PageCache, fingerprint_bytes
+from ocr_tokens import OcrTokens, Span
+from regex_engine import ScanBudget, ScanResult, compile_patterns, findall_value, iter_matches, scan
 
 # --- Setup & Model Loading ---
 
@@ -15,53 +21,125 @@ except OSError:
     print("spaCy English model not found. Install with: python -m spacy download en_core_web_sm")
     nlp = None
 
+# tesserocr talks to the Tesseract library in-process, so pixels can be handed
+# over from memory. Without it we fall back to pytesseract, which writes each
+# image to a temporary PNG for the tesseract subprocess.
+# Tesseract API objects are not thread-safe, so each thread gets its own.
+try:
+    from tesserocr import PyTessBaseAPI, RIL, iterate_level
+    _tess_local = threading.local()
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
 # --- Core PII and Redaction Functions ---
 
 def extract_text_with_boxes(image: Image.Image) -> List[Dict[str, Any]]:
     """
     Performs OCR on a PIL Image and returns a list of dictionaries,
-    each containing text and its bounding box.
+    each containing text and its bounding box. This is the per-word view
+    of extract_tokens(), which returns the same words as one OcrTokens table.
+    """
+    tokens = extract_tokens(image)
+    return [{'text': word, 'box': tuple(box)} for word, box in zip(tokens.words(), tokens.boxes.tolist())]
+
+def _tesserocr_data(pixels: np.ndarray) -> Dict[str, list]:
+    """Runs in-process OCR on an H x W x 3 uint8 array and returns image_to_data-style columns."""
+    pixels = np.ascontiguousarray(pixels)
+    height, width = pixels.shape[:2]
+    data = {'text': [], 'conf': [], 'left': [], 'top': [], 'width': [], 'height': [],
+            'block_num': [], 'par_num': [], 'line_num': []}
+    api = getattr(_tess_local, 'api', None)
+    if api is None:
+        api = _tess_local.api = PyTessBaseAPI()
+    api.SetImageBytes(pixels.tobytes(), width, height, 3, width * 3)
+    api.Recognize()
+    line = 0
+    for word in iterate_level(api.GetIterator(), RIL.WORD):
+        if word.IsAtBeginningOf(RIL.TEXTLINE):
+            line += 1
+        box = word.BoundingBox(RIL.WORD)
+        if box is None:
+            continue
+        x1, y1, x2, y2 = box
+        data['text'].append(word.GetUTF8Text(RIL.WORD) or "")
+        data['conf'].append(word.Confidence(RIL.WORD))
+        data['left'].append(x1)
+        data['top'].append(y1)
+        data['width'].append(x2 - x1)
+        data['height'].append(y2 - y1)
+        data['block_num'].append(0)
+        data['par_num'].append(0)
+        data['line_num'].append(line)
+    return data
+
+def extract_tokens(image: Union[Image.Image, np.ndarray], min_conf: float = 60) -> OcrTokens:
+    """
+    Performs OCR on a PIL Image or an H x W x 3 uint8 array (e.g. a
+    PageFrame view) and returns the words as a compact OcrTokens table.
+    Arrays are passed to Tesseract in memory when tesserocr is installed.
     """
     try:
+        if TESSEROCR_AVAILABLE and isinstance(image, np.ndarray):
+            return OcrTokens.from_tesseract(_tesserocr_data(image), min_conf)
         import pytesseract
         data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
-        results = []
-        n_boxes = len(data['level'])
-        for i in range(n_boxes):
-            if int(data['conf'][i]) > 60 and data['text'][i].strip():
-                (x, y, w, h) = (data['left'][i], data['top'][i], data['width'][i], data['height'][i])
-                results.append({
-                    'text': data['text'][i],
-                    'box': (x, y, x + w, y + h)
-                })
-        return results
+        return OcrTokens.from_tesseract(data, min_conf)
     except Exception as e:
-        print(f"❌ OCR Error in extract_text_with_boxes: {e}")
-        return []
+        print(f"❌ OCR Error in extract_tokens: {e}")
+        return OcrTokens.empty()
 
-def detect_pii_patterns(text: str) -> Dict[str, List[str]]:
+PII_PATTERNS = {
+    'email': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
+    'phone': r'\b(?:\+?1[-.\s]?)?\(?([0-9]{3})\)?[-.\s]?([0-9]{3})[-.\s]?([0-9]{4})\b',
+    'ssn': r'\b\d{3}-?\d{2}-?\d{4}\b',
+    'credit_card': r'\b(?:\d{4}[-\s]?){3}\d{4}\b',
+    'aadhaar': r'\b\d{4}\s\d{4}\s\d{4}\b',
+    'account_number': r'\b\d{9,18}\b'
+}
+
+# Patterns used for replacement with dummy values
+REPLACEMENT_PATTERNS = {
+    'phone': r'\b(?:\+?91[-\s]?)?(?:\d{3}[-\s]?\d{3}[-\s]?\d{4}|\d{5}[-\s]?\d{5}|\d{10})\b',
+    'credit_card': r'\b(?:\d{4}[-\s]?){3}\d{4}\b',
+    'aadhaar': r'\b\d{4}\s\d{4}\s\d{4}\b',
+    'ssn': r'\b\d{3}-?\d{2}-?\d{4}\b',
+    'account_number': r'\b\d{9,18}\b'
+}
+
+# Compiled once with RE2 when available (see regex_engine.py)
+COMPILED_PII_PATTERNS = compile_patterns(PII_PATTERNS, ignore_case=True)
+COMPILED_REPLACEMENT_PATTERNS = compile_patterns(REPLACEMENT_PATTERNS)
+# Size of the pieces iter_spliced() yields when streaming sanitized text
+SPLICE_CHUNK_SIZE = 64 * 1024
+NO_TEXT_MESSAGE = "No text could be extracted from the document."
+
+class NoTextExtracted(ValueError):
+    """Raised by analyze_document_spans for a document without any extractable text."""
+
+def scan_pii(text: str, budget: Optional[ScanBudget] = None) -> ScanResult:
+    """Scans text with every PII pattern, stopping early if the budget runs out."""
+    return scan(COMPILED_PII_PATTERNS, text, budget)
+
+def detect_pii_patterns(text: str, budget: Optional[ScanBudget] = None) -> Dict[str, List[str]]:
     """Detects various PII patterns and returns them organized in a dictionary."""
-    pii_patterns = {
-        'email': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
-        'phone': r'\b(?:\+?1[-.\s]?)?\(?([0-9]{3})\)?[-.\s]?([0-9]{3})[-.\s]?([0-9]{4})\b',
-        'ssn': r'\b\d{3}-?\d{2}-?\d{4}\b',
-        'credit_card': r'\b(?:\d{4}[-\s]?){3}\d{4}\b',
-        'aadhaar': r'\b\d{4}\s\d{4}\s\d{4}\b',
-        'account_number': r'\b\d{9,18}\b'
-    }
-    detected_pii = {}
-    for pii_type, pattern in pii_patterns.items():
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        if matches:
-            detected_pii[pii_type] = matches
-    return detected_pii
+    result = scan_pii(text, budget)
+    return {pii_type: [findall_value(m) for m in matches] for pii_type, matches in result.matches.items()}
+
+def detect_pii_regex(text: str, budget: Optional[ScanBudget] = None) -> List[Span]:
+    """Detects PII patterns and returns them as spans with character offsets into text."""
+    spans = []
+    for pii_type, compiled in COMPILED_PII_PATTERNS.items():
+        for match in iter_matches(compiled, text, budget):
+            spans.append(Span(pii_type, match.group(), match.start(), match.end()))
+    return spans
 
 class YoloSignatureDetector:
     """Placeholder class for YOLO signature detection."""
     def __init__(self, model_path: str):
         self.model = None
         self.model_path = model_path
-    def detect_signatures(self, image: Image.Image) -> List[List[int]]:
+    def detect_signatures(self, image: Union[Image.Image, np.ndarray]) -> List[List[int]]:
         return []
 
 class SpacyNer:
@@ -74,7 +152,8 @@ class SpacyNer:
         entities = []
         for ent in doc.ents:
             if ent.label_ in ['PERSON', 'ORG', 'GPE', 'DATE', 'MONEY']:
-                entities.append({'type': ent.label_.lower(), 'text': ent.text})
+                entities.append({'type': ent.label_.lower(), 'text': ent.text,
+                                 'start': ent.start_char, 'end': ent.end_char})
         return entities
 
 def redact_boxes(image: Image.Image, boxes: List[tuple], output_path: str = None, method: str = 'blackbox') -> None:
@@ -124,59 +203,243 @@ def load_dummy_data(file_path: str = "backend/results/dummy_data.json") -> Dict:
         print(f"⚠️ Warning: Could not load dummy data from '{file_path}'.")
         return {}
 
-def replace_numerical_pii(text: str, dummy_data: Dict) -> str:
+def replace_numerical_pii(text: str, dummy_data: Dict, budget: Optional[ScanBudget] = None) -> str:
     """
     Finds and replaces numerical PII in a text with corresponding values
     from the flattened dummy_data dictionary.
     """
+    return _replace_numerical_pii(text, dummy_data, budget)[0]
+
+def _replace_numerical_pii(text: str, dummy_data: Dict, budget: Optional[ScanBudget] = None) -> Tuple[str, List[str]]:
+    """Same as replace_numerical_pii, but also returns the patterns the budget cut short."""
     if not dummy_data:
-        return text
+        return text, []
 
-    sanitized_text = text
+    spans, incomplete = find_replacement_spans(text, dummy_data, budget)
+    return splice_spans(text, spans), incomplete
 
-    pii_patterns_to_replace = {
-        'phone': r'\b(?:\+?91[-\s]?)?(?:\d{3}[-\s]?\d{3}[-\s]?\d{4}|\d{5}[-\s]?\d{5}|\d{10})\b',
-        'credit_card': r'\b(?:\d{4}[-\s]?){3}\d{4}\b',
-        'aadhaar': r'\b\d{4}\s\d{4}\s\d{4}\b',
-        'ssn': r'\b\d{3}-?\d{2}-?\d{4}\b',
-        'account_number': r'\b\d{9,18}\b'
-    }
+def find_replacement_spans(text: str, dummy_data: Dict, budget: Optional[ScanBudget] = None) -> Tuple[List[Span], List[str]]:
+    """
+    Finds the numerical PII to be replaced with dummy values as
+    non-overlapping spans of the original text, sorted by offset. Where
+    matches of different patterns overlap, the pattern listed first in
+    REPLACEMENT_PATTERNS wins. Also returns the patterns the budget cut short.
+    """
+    active = {pii_type: compiled for pii_type, compiled in COMPILED_REPLACEMENT_PATTERNS.items() if pii_type in dummy_data}
+    result = scan(active, text, budget)
+    spans: List[Span] = []
+    starts: List[int] = []
+    for pii_type in active:
+        for match in result.matches.get(pii_type, []):
+            i = bisect_right(starts, match.start())
+            if (i and spans[i - 1].end > match.start()) or (i < len(spans) and spans[i].start < match.end()):
+                continue
+            starts.insert(i, match.start())
+            spans.insert(i, Span(pii_type, match.group(), match.start(), match.end(), replacement=dummy_data[pii_type]))
+    return spans, list(result.incomplete)
 
-    for pii_type, pattern in pii_patterns_to_replace.items():
-        if pii_type in dummy_data:
-            dummy_value = dummy_data[pii_type]
-            sanitized_text = re.sub(pattern, dummy_value, sanitized_text)
-            
-    return sanitized_text
+def splice_spans(text: str, spans: Sequence[Span]) -> str:
+    """Builds the text with every (sorted, non-overlapping) span swapped for its replacement in one pass."""
+    pieces = []
+    last = 0
+    for span in spans:
+        pieces.append(text[last:span.start])
+        pieces.append(span.replacement)
+        last = span.end
+    pieces.append(text[last:])
+    return "".join(pieces)
+
+def iter_spliced(text: str, spans: Sequence[Span], chunk_size: int = SPLICE_CHUNK_SIZE) -> Iterator[str]:
+    """Same as splice_spans, but yields the result in chunks of about chunk_size characters."""
+    pending = []
+    pending_size = 0
+    last = 0
+    for span in list(spans) + [None]:
+        start = len(text) if span is None else span.start
+        while last < start:
+            step = min(start, last + chunk_size - pending_size)
+            pending.append(text[last:step])
+            pending_size += step - last
+            last = step
+            if pending_size >= chunk_size:
+                yield "".join(pending)
+                pending, pending_size = [], 0
+        if span is not None:
+            pending.append(span.replacement)
+            pending_size += len(span.replacement)
+            last = span.end
+            if pending_size >= chunk_size:
+                yield "".join(pending)
+                pending, pending_size = [], 0
+    if pending:
+        yield "".join(pending)
 
 # --- Main Orchestrator Function ---
 
-def analyze_and_sanitize_document(file_content: bytes, content_type: str) -> Dict[str, Any]:
+def analyze_and_sanitize_document(file_content: bytes, content_type: str, lineage_id: Optional[str] = None,
+                                  strict: bool = False) -> Dict[str, Any]:
     """
     This is the main pipeline function that orchestrates the entire process.
     It takes a file's content, processes it, and returns a structured dictionary.
+    When a lineage_id is given, results are cached per page so that later
+    revisions of the same document only re-process their changed pages.
+    With strict=True, a file whose text can't be extracted raises instead
+    of producing an error message as its text.
     """
+    if lineage_id:
+        return _analyze_revision(file_content, content_type, lineage_id)
+
     # Note: Requires text_extractor.py to be in the same project directory
-    from text_extractor import extract_text
-    original_text = extract_text(content_type, file_content)
+    from text_extractor import extract_text, extract_text_strict
+    original_text = (extract_text_strict if strict else extract_text)(content_type, file_content)
 
     if not original_text.strip():
         return {
             "pii_count": 0,
             "pii_found": {},
             "original_text": original_text,
-            "sanitized_text": "No text could be extracted from the document."
+            "sanitized_text": NO_TEXT_MESSAGE
         }
 
-    pii_data = detect_pii_patterns(original_text)
-    pii_count = sum(len(items) for items in pii_data.values())
-
     dummy_values = load_dummy_data()
-    sanitized_text = replace_numerical_pii(original_text, dummy_values)
+    page = _analyze_page(original_text, dummy_values, ScanBudget())
+    pii_data = page["pii_found"]
     
     return {
-        "pii_count": pii_count,
+        "pii_count": sum(len(items) for items in pii_data.values()),
         "pii_found": pii_data,
         "original_text": original_text,
-        "sanitized_text": sanitized_text
-    }
\ No newline at end of file
+        "sanitized_text": page["sanitized_text"],
+        "scan": _scan_report([page])
+    }
+
+def analyze_document_spans(file_content: bytes, content_type: str) -> Dict[str, Any]:
+    """
+    Variant of analyze_and_sanitize_document that doesn't build the
+    sanitized text. Returns the extracted "text" and the replacements as
+    "spans" (Span objects with offsets into that text), so that callers can
+    send only the spans or stream the sanitized text with iter_spliced().
+    Where analyze_and_sanitize_document returns NO_TEXT_MESSAGE as the
+    sanitized text, this raises NoTextExtracted.
+    """
+    from text_extractor import extract_text
+    text = extract_text(content_type, file_content)
+    if not text.strip():
+        raise NoTextExtracted(NO_TEXT_MESSAGE)
+    pii_data, spans, incomplete = _detect_page(text, load_dummy_data(), ScanBudget())
+    return {
+        "text": text,
+        "spans": spans,
+        "pii_count": sum(len(items) for items in pii_data.values()),
+        "pii_found": pii_data,
+        "scan": _scan_report([{"incomplete_patterns": incomplete}])
+    }
+
+def _detect_page(text: str, dummy_values: Dict, budget: ScanBudget) -> Tuple[Dict[str, List[Any]], List[Span], List[str]]:
+    """Returns the PII found in a page, its replacement spans and the patterns the budget cut short."""
+    result = scan_pii(text, budget)
+    spans, unreplaced = find_replacement_spans(text, dummy_values, budget) if dummy_values else ([], [])
+    pii_data = {pii_type: [findall_value(m) for m in matches] for pii_type, matches in result.matches.items()}
+    return pii_data, spans, sorted(set(result.incomplete) | set(unreplaced))
+
+def _analyze_page(text: str, dummy_values: Dict, budget: ScanBudget) -> Dict[str, Any]:
+    """Runs detection and replacement on the text of a single page within the document's scan budget."""
+    pii_data, spans, incomplete = _detect_page(text, dummy_values, budget)
+    return {
+        "text": text,
+        "pii_found": pii_data,
+        "sanitized_text": splice_spans(text, spans),
+        "incomplete_patterns": incomplete
+    }
+
+def _scan_report(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Summarizes whether every page was fully scanned. If the scan budget ran
+    out, the results are partial and the listed patterns were cut short.
+    """
+    incomplete = sorted({name for page in pages for name in page.get("incomplete_patterns", [])})
+    engines = sorted({compiled.engine for compiled in COMPILED_PII_PATTERNS.values()})
+    return {"complete": not incomplete, "incomplete_patterns": incomplete, "engine": "/".join(engines)}
+
+def _analyze_revision(file_content: bytes, content_type: str, lineage_id: str) -> Dict[str, Any]:
+    """
+    Incremental variant of analyze_and_sanitize_document. Pages whose
+    fingerprint is already stored for the lineage reuse their stored results;
+    only changed or new pages are extracted and analyzed.
+    """
+    from text_extractor import extract_text, extract_pdf_pages
+
+    dummy_values = load_dummy_data()
+    # Stored results are only valid for the replacement values they were made with
+    settings = fingerprint_bytes(json.dumps(dummy_values, sort_keys=True).encode("utf-8"))
+    cache = PageCache()
+    stored_pages = cache.load(lineage_id, settings)
+
+    if "pdf" in content_type:
+        pages = extract_pdf_pages(file_content, stored_pages)
+    else:
+        # Other formats have no page structure; the whole file is one page
+        fingerprint = fingerprint_bytes(file_content)
+        text = None if fingerprint in stored_pages else extract_text(content_type, file_content)
+        pages = [(fingerprint, text)]
+
+    budget = ScanBudget()
+    records = {}
+    ordered_records = []
+    pages_reused = 0
+    for fingerprint, text in pages:
+        if text is None:
+            record = stored_pages[fingerprint]
+            pages_reused += 1
+        else:
+            record = records.get(fingerprint) or _analyze_page(text, dummy_values, budget)
+        records[fingerprint] = record
+        ordered_records.append(record)
+    # Pages cut short by the scan budget are re-scanned on the next revision
+    cache.save(lineage_id, settings, {fp: r for fp, r in records.items() if not r.get("incomplete_patterns")})
+
+    original_text = "".join(record["text"] for record in ordered_records)
+    pii_data = {}
+    for record in ordered_records:
+        for pii_type, matches in record["pii_found"].items():
+            pii_data.setdefault(pii_type, []).extend(matches)
+
+    results = {
+        "pii_count": sum(len(items) for items in pii_data.values()),
+        "pii_found": pii_data,
+        "original_text": original_text,
+        "sanitized_text": "".join(record["sanitized_text"] for record in ordered_records),
+        "lineage_id": lineage_id,
+        "pages_total": len(ordered_records),
+        "pages_reused": pages_reused,
+        "scan": _scan_report(ordered_records)
+    }
+    if not original_text.strip():
+        results["sanitized_text"] = NO_TEXT_MESSAGE
+    return results
+
+def sanitize_docx(source, output, dummy_values: Optional[Dict] = None) -> Dict[str, Any]:
+    """
+    Writes a sanitized copy of a DOCX (bytes, path or file object) to output.
+    Numerical PII is replaced with dummy values inside the affected text runs
+    only; formatting, tables, headers, footers and every other archive member
+    are carried over unchanged.
+    """
+    from docx_engine import extract_docx, write_sanitized_docx
+
+    if dummy_values is None:
+        dummy_values = load_dummy_data()
+    budget = ScanBudget()
+    docx_text = extract_docx(source)
+    result = scan_pii(docx_text.text, budget)
+    spans, unreplaced = find_replacement_spans(docx_text.text, dummy_values, budget)
+    runs_rewritten = write_sanitized_docx(source, docx_text, [(s.start, s.end, s.replacement) for s in spans], output)
+
+    pii_data = {pii_type: [findall_value(m) for m in matches] for pii_type, matches in result.matches.items()}
+    return {
+        "pii_count": sum(len(items) for items in pii_data.values()),
+        "pii_found": pii_data,
+        "replacements": len(spans),
+        "runs_rewritten": runs_rewritten,
+        "scan": _scan_report([{"incomplete_patterns": sorted(set(result.incomplete) | set(unreplaced))}])
+    }
@@ -0,0 +1,187 @@
+"""
+On-demand profiling of single requests.
+
+A caller that sends the `X-SanitiAI-Profile` header (or `?profile=`) with
+the token configured in SANITIAI_PROFILE_TOKEN gets its request profiled:
+a sampling profiler records the stacks of the thread running the pipeline.
+Adding `?profile_allocations=true` also records where memory was allocated
+(tracemalloc). The result is kept in memory under the request ID (returned
+in the X-Request-ID header) and can be fetched from the profiles endpoint,
+either as JSON or as folded stacks that flamegraph.pl / speedscope read.
+
+Profiling is disabled when SANITIAI_PROFILE_TOKEN is unset. Requests that
+don't ask for it start no profiler, but they share the process with those
+that do: while a request is profiled, the sampler thread briefly takes the
+GIL every SAMPLE_INTERVAL, and allocation tracing is process-wide, so with
+it every concurrent request allocates noticeably slower until the profiled
+request finishes. Use allocation profiling on a quiet worker.
+"""
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+PROFILE_TOKEN_ENV = "SANITIAI_PROFILE_TOKEN"
+PROFILE_HEADER = "X-SanitiAI-Profile"
+PROFILE_QUERY_PARAM = "profile"
+# Opt-in for allocation stats, which slow down every request in the process
+ALLOCATIONS_QUERY_PARAM = "profile_allocations"
+REQUEST_ID_HEADER = "X-Request-ID"
+# Number of profiles kept; the oldest is dropped when a new one is stored
+MAX_PROFILES = 20
+SAMPLE_INTERVAL = 0.005  # seconds
+# Number of allocation sites reported per profile
+TOP_ALLOCATIONS = 25
+TRACEMALLOC_FRAMES = 10
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def profiling_authorized(token: Optional[str]) -> bool:
+    """True if `token` matches the configured profiling token."""
+    expected = os.environ.get(PROFILE_TOKEN_ENV)
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(token.encode(), expected.encode())
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread at a fixed interval from a helper thread."""
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    @staticmethod
+    def _fold(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self._fold(frame)] += 1
+                self.samples += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self) -> str:
+        """Stacks in the "frame;frame;frame count" format used by flame graph tools."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+# tracemalloc is process-wide; it runs while at least one profiled request is active
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def _start_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        tracemalloc.reset_peak()
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc() -> Dict:
+    """Returns allocation stats for the request and stops tracing if it was the last one."""
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+    top = [{
+        "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+        "size_bytes": stat.size,
+        "count": stat.count,
+    } for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]]
+    # Allocations of concurrent requests are included too; profile on a quiet worker for exact numbers
+    return {"current_bytes": current, "peak_bytes": peak, "top": top}
+
+
+class ProfileStore:
+    """Keeps the most recent profiles in memory, keyed by request ID."""
+    def __init__(self, max_profiles: int = MAX_PROFILES):
+        self.max_profiles = max_profiles
+        self._profiles: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, request_id: str, profile: Dict) -> None:
+        with self._lock:
+            self._profiles[request_id] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+
+    def get(self, request_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._profiles.get(request_id)
+
+
+profile_store = ProfileStore()
+
+
+@contextmanager
+def profile_request(request_id: str, label: str = "", allocations: bool = False):
+    """
+    Profiles the code run inside the block on the current thread and stores
+    the result. With allocations=True, memory allocations are traced too.
+    """
+    profiler = SamplingProfiler(threading.get_ident())
+    if allocations:
+        _start_tracemalloc()
+    started = time.perf_counter()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        duration = time.perf_counter() - started
+        allocation_stats = _stop_tracemalloc() if allocations else None
+        profile_store.add(request_id, {
+            "request_id": request_id,
+            "label": label,
+            "created": time.time(),
+            "duration": round(duration, 4),
+            "sample_interval": profiler.interval,
+            "samples": profiler.samples,
+            "folded": profiler.folded(),
+            "allocations": allocation_stats,
+        })
+
+
+def wants_allocations(value: Optional[str]) -> bool:
+    return (value or "").lower() in ("1", "true", "yes")
+
+
+def maybe_profile(token: Optional[str], request_id: str, label: str = "", allocations: bool = False):
+    """profile_request() for authorized callers, a no-op context for everyone else."""
+    if token is not None and profiling_authorized(token):
+        return profile_request(request_id, label, allocations)
+    return nullcontext()
@@ -0,0 +1,161 @@
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# RE2 (pip install google-re2) guarantees linear-time matching, so garbage
+# or adversarial OCR text cannot make a pattern backtrack for minutes. It is
+# optional (see the README); patterns fall back to Python's `re` when it is
+# not installed or a pattern uses syntax RE2 doesn't support.
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    re2 = None
+    RE2_AVAILABLE = False
+
+# Default time budget for scanning one document with all patterns
+SCAN_TIME_BUDGET = 10.0  # seconds
+# Text is scanned in chunks so that the budget is checked regularly and a
+# backtracking `re` pattern can only ever work on a bounded window of text.
+SCAN_CHUNK_SIZE = 16 * 1024
+# Chunks overlap so that matches crossing a chunk boundary are still found
+SCAN_CHUNK_OVERLAP = 512
+
+
+def max_match_width(pattern: str, ignore_case: bool = False) -> Optional[int]:
+    """Longest possible match of a pattern, or None if it is unbounded (or can't be determined)."""
+    try:
+        width = sre_parse.parse(pattern, re.IGNORECASE if ignore_case else 0).getwidth()[1]
+    except Exception:
+        return None
+    return width if width < sre_parse.MAXREPEAT else None
+
+
+class CompiledPattern:
+    """
+    A regex compiled with the fastest available engine. `overlap` is how far
+    chunks scanned with this pattern overlap: wide enough for its longest
+    match (plus one character for a trailing word boundary) when that is bounded.
+    """
+    __slots__ = ('name', 'pattern', 'engine', 'regex', 'overlap')
+
+    def __init__(self, name: str, pattern: str, ignore_case: bool = False, engine: Optional[str] = None):
+        self.name = name
+        self.pattern = pattern
+        width = max_match_width(pattern, ignore_case)
+        self.overlap = None if width is None else width + 1
+        self.regex = None
+        if engine in (None, 're2') and RE2_AVAILABLE:
+            try:
+                self.regex = re2.compile(("(?i)" if ignore_case else "") + pattern)
+                self.engine = 're2'
+            except Exception:
+                self.regex = None
+        if self.regex is None:
+            self.regex = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+            self.engine = 're'
+
+    def __repr__(self) -> str:
+        return f"CompiledPattern({self.name!r}, engine={self.engine!r})"
+
+
+def compile_patterns(patterns: Dict[str, str], ignore_case: bool = False, engine: Optional[str] = None) -> Dict[str, CompiledPattern]:
+    return {name: CompiledPattern(name, pattern, ignore_case, engine) for name, pattern in patterns.items()}
+
+
+class ScanBudget:
+    """A wall-clock deadline shared by every pattern scanned for one document."""
+    def __init__(self, seconds: float = SCAN_TIME_BUDGET):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+
+class ScanResult:
+    """
+    Matches found within the scan budget. When the budget ran out,
+    `complete` is False and `incomplete` maps each pattern that was not
+    fully scanned to the text offset it had reached.
+    """
+    def __init__(self):
+        self.matches: Dict[str, List[Any]] = {}
+        self.incomplete: Dict[str, int] = {}
+
+    @property
+    def complete(self) -> bool:
+        return not self.incomplete
+
+    def report(self) -> Dict[str, Any]:
+        return {"complete": self.complete, "incomplete_patterns": dict(self.incomplete)}
+
+
+def iter_matches(compiled: CompiledPattern, text: str, budget: Optional[ScanBudget] = None):
+    """
+    Yields the matches of one pattern in order, scanning the text in
+    overlapping chunks. Returns (via StopIteration.value) the offset where
+    scanning stopped, which is len(text) unless the budget ran out.
+
+    The matches are the same as those of a single finditer() pass over the
+    whole text for patterns of bounded length, and otherwise for any match
+    no longer than SCAN_CHUNK_OVERLAP.
+    """
+    regex = compiled.regex
+    overlap = SCAN_CHUNK_OVERLAP if compiled.overlap is None else max(compiled.overlap, SCAN_CHUNK_OVERLAP)
+    length = len(text)
+    chunk_start = 0
+    pos = 0
+    while chunk_start < length:
+        if budget is not None and budget.expired():
+            return chunk_start
+        core_end = min(chunk_start + SCAN_CHUNK_SIZE, length)
+        endpos = min(core_end + overlap, length)
+        while pos < core_end:
+            match = regex.search(text, pos, endpos)
+            window = endpos
+            # A match that reaches the window end may have been cut short, or
+            # only matched because the text appeared to end there (e.g. \b);
+            # search again from its start with a wider window.
+            while match is not None and match.end() == window < length:
+                window = min(length, window + max(window - match.start(), overlap))
+                match = regex.search(text, match.start(), window)
+            # Matches starting in the overlap belong to the next chunk
+            if match is None or match.start() >= core_end:
+                break
+            yield match
+            pos = match.end() if match.end() > match.start() else match.end() + 1
+        chunk_start = core_end
+        pos = max(pos, core_end)
+    return length
+
+
+def scan(patterns: Dict[str, CompiledPattern], text: str, budget: Optional[ScanBudget] = None) -> ScanResult:
+    """Collects the matches of every pattern, stopping when the budget runs out."""
+    result = ScanResult()
+    for name, compiled in patterns.items():
+        matches = []
+        iterator = iter_matches(compiled, text, budget)
+        while True:
+            try:
+                matches.append(next(iterator))
+            except StopIteration as stop:
+                if stop.value < len(text):
+                    result.incomplete[name] = stop.value
+                break
+        if matches:
+            result.matches[name] = matches
+    return result
+
+
+def findall_value(match) -> Any:
+    """Returns what re.findall would have returned for this match."""
+    groups = match.groups()
+    if not groups:
+        return match.group()
+    return groups[0] if len(groups) == 1 else groups
@@ -0,0 +1,119 @@
+"""
+Fuzz / benchmark harness for the PII regexes.
+
+For every pattern it searches for inputs that make matching slow: random
+OCR-like garbage plus repetitions of short units built from the pattern's
+own characters (the usual trigger for catastrophic backtracking). Each
+candidate is timed at two sizes; a pattern whose time grows much faster
+than the input is flagged as super-linear.
+
+Usage:
+    python regex_fuzz.py                     # all patterns, best available engine
+    python regex_fuzz.py --engine re         # force Python's re
+    python regex_fuzz.py --pattern url --size 4000 --candidates 500
+"""
+import argparse
+import random
+import string
+import time
+from typing import Dict, List, Tuple
+
+from regex_engine import CompiledPattern, RE2_AVAILABLE
+
+# Time ratio between the 2x and 1x inputs above which a pattern is flagged
+SUPERLINEAR_RATIO = 3.0
+# Characters that show up in OCR noise around PII
+NOISE_CHARACTERS = string.ascii_letters + string.digits + " -.@/:?#()+_%&=\n"
+
+
+def collect_patterns() -> Dict[str, Tuple[str, bool]]:
+    """Returns every PII pattern in the backend as name -> (pattern, ignore_case)."""
+    from pii_analyzer import PII_PATTERNS, REPLACEMENT_PATTERNS
+    from analyze_pii_content import PII_REGEX_PATTERNS
+    from nlp.pii_detector import PII_PATTERNS as NLP_PII_PATTERNS
+
+    patterns = {}
+    patterns.update({f"pii_analyzer.{k}": (v, True) for k, v in PII_PATTERNS.items()})
+    patterns.update({f"pii_analyzer.replace.{k}": (v, False) for k, v in REPLACEMENT_PATTERNS.items()})
+    patterns.update({f"analyze_pii_content.{k}": (c.pattern, True) for k, c in PII_REGEX_PATTERNS.items()})
+    patterns.update({f"nlp.pii_detector.{k}": (v, False) for k, v in NLP_PII_PATTERNS.items()})
+    return patterns
+
+
+def pattern_alphabet(pattern: str) -> str:
+    """Characters likely to drive a pattern deep into its alternatives."""
+    literals = {c for c in pattern if c.isprintable() and c not in "\\[](){}|*+?^$"}
+    return "".join(sorted(literals | set(string.digits) | set(" -.@/:a")))
+
+
+def candidate_inputs(alphabet: str, size: int, count: int, rng: random.Random) -> List[Tuple[str, str]]:
+    """Returns (description, text) candidates of roughly `size` characters."""
+    candidates = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.2:
+            text = "".join(rng.choice(NOISE_CHARACTERS) for _ in range(size))
+            candidates.append(("random noise", text))
+        else:
+            unit = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4)))
+            prefix = rng.choice(["", "http://", "+1 ", "a@", "("])
+            breaker = rng.choice(["", "!", " ", "\x00"])
+            repeat = max(1, (size - len(prefix)) // len(unit))
+            candidates.append((f"{prefix!r} + {unit!r} * n + {breaker!r}", prefix + unit * repeat + breaker))
+    return candidates
+
+
+def time_scan(compiled: CompiledPattern, text: str) -> float:
+    start = time.perf_counter()
+    for _ in compiled.regex.finditer(text):
+        pass
+    return time.perf_counter() - start
+
+
+def fuzz_pattern(name: str, pattern: str, ignore_case: bool, engine: str, size: int, count: int, seed: int) -> Dict:
+    compiled = CompiledPattern(name, pattern, ignore_case, engine)
+    rng = random.Random(seed)
+    worst = None
+    for description, text in candidate_inputs(pattern_alphabet(pattern), size, count, rng):
+        elapsed = time_scan(compiled, text)
+        if worst is None or elapsed > worst["time"]:
+            worst = {"input": description, "text": text, "time": elapsed}
+
+    # Re-time the slowest candidate at double size to estimate its growth
+    doubled = worst["text"][:-1] * 2 + worst["text"][-1:]
+    worst["time_2x"] = time_scan(compiled, doubled)
+    worst["ratio"] = worst["time_2x"] / max(worst["time"], 1e-9)
+    worst["engine"] = compiled.engine
+    worst["name"] = name
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find slow inputs for the PII regexes.")
+    parser.add_argument("--engine", choices=["re", "re2"], default=None,
+                        help="Regex engine to test (default: RE2 when installed, else re)")
+    parser.add_argument("--pattern", default=None, help="Only fuzz patterns whose name contains this string")
+    parser.add_argument("--size", type=int, default=5000, help="Length of generated inputs")
+    parser.add_argument("--candidates", type=int, default=200, help="Inputs tried per pattern")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.engine == "re2" and not RE2_AVAILABLE:
+        parser.error("RE2 is not installed (pip install google-re2)")
+
+    flagged = 0
+    print(f"{'pattern':45} {'engine':6} {'time':>9} {'time@2x':>9} {'ratio':>6}  slowest input")
+    for name, (pattern, ignore_case) in collect_patterns().items():
+        if args.pattern and args.pattern not in name:
+            continue
+        worst = fuzz_pattern(name, pattern, ignore_case, args.engine, args.size, args.candidates, args.seed)
+        slow = worst["ratio"] > SUPERLINEAR_RATIO
+        flagged += slow
+        print(f"{name:45} {worst['engine']:6} {worst['time'] * 1000:8.2f}ms {worst['time_2x'] * 1000:8.2f}ms "
+              f"{worst['ratio']:6.1f}  {worst['input']}{'  ⚠️ SUPER-LINEAR' if slow else ''}")
+
+    print(f"\n{flagged} pattern(s) flagged as super-linear.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import BinaryIO, Callable, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Keys are "<sha256 of the content>.<extension>"
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]{1,10})?$")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def make_key(digest: str, extension: str = "") -> str:
+    extension = extension.lower().lstrip(".")
+    return f"{digest}.{extension}" if extension else digest
+
+
+def evict_files(entries: Iterable[os.DirEntry], ttl_seconds: Optional[float], max_bytes: Optional[int],
+                now: Optional[float] = None) -> Tuple[int, int]:
+    """
+    Deletes the files not modified (i.e. accessed) within ttl_seconds, then
+    the least recently accessed ones until the rest fit max_bytes.
+    Returns (files removed, bytes freed).
+    """
+    now = time.time() if now is None else now
+    removed = freed = 0
+    kept = []
+    for entry in entries:
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if ttl_seconds is not None and now - stat.st_mtime > ttl_seconds:
+            removed, freed = removed + 1, freed + _remove(entry.path, stat.st_size)
+        else:
+            kept.append((stat.st_mtime, stat.st_size, entry.path))
+
+    if max_bytes is not None:
+        total = sum(size for _, size, _ in kept)
+        for _, size, path in sorted(kept):
+            if total <= max_bytes:
+                break
+            total -= size
+            removed, freed = removed + 1, freed + _remove(path, size)
+    return removed, freed
+
+
+def _remove(path: str, size: int) -> int:
+    try:
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def run_sweeper(name: str, sweep: Callable[[], Tuple[int, int]], interval_seconds: float) -> threading.Thread:
+    """Calls sweep() every interval_seconds on a daemon thread, logging what it removed."""
+    def run():
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                removed, freed = sweep()
+                if removed:
+                    logger.info(f"Storage sweep of '{name}': removed {removed} files ({freed} bytes)")
+            except Exception as e:
+                logger.error(f"Storage sweep of '{name}' failed: {e}")
+
+    thread = threading.Thread(target=run, name=f"sweeper:{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+class ContentStore:
+    """
+    Content-addressed file store.
+
+    Files are named by the SHA-256 of their content and sharded into two
+    levels of sub-directories (ab/cd/abcd...), so no directory grows huge and
+    identical files are only stored once. A file's modification time is
+    bumped whenever it is stored or opened again, and is used as its last
+    access time: sweep() deletes files not accessed within `ttl_seconds`,
+    then the least recently accessed ones until the store fits `max_bytes`.
+    """
+    def __init__(self, root: str, ttl_seconds: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._sweeper = None
+
+    # --- Paths ---
+
+    def path_for(self, key: str) -> str:
+        if not KEY_PATTERN.match(key):
+            raise ValueError(f"Invalid storage key: {key!r}")
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def temp_path(self, extension: str = "") -> str:
+        """Returns a fresh path inside the store for a file that will be added with put_file()."""
+        fd, path = tempfile.mkstemp(dir=self.tmp_dir, suffix=f".{extension.lstrip('.')}" if extension else "")
+        os.close(fd)
+        return path
+
+    # --- Writing ---
+
+    def put_stream(self, stream: BinaryIO, extension: str = "") -> str:
+        """Stores the content of a stream, hashing it while it is written to disk. Returns its key."""
+        digest = hashlib.sha256()
+        tmp_path = self.temp_path()
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    f.write(chunk)
+            return self._commit(tmp_path, make_key(digest.hexdigest(), extension))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def put_file(self, tmp_path: str, extension: str = "") -> str:
+        """Moves a finished file (e.g. from temp_path()) into the store. Returns its key."""
+        digest = hashlib.sha256()
+        with open(tmp_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        try:
+            return self._commit(tmp_path, make_key(digest.hexdigest(), extension))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _commit(self, tmp_path: str, key: str) -> str:
+        path = self.path_for(key)
+        if os.path.exists(path):
+            # Same content is already stored; just refresh its access time
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return key
+
+    # --- Reading ---
+
+    def open_path(self, key: str) -> Optional[str]:
+        """Returns the path of a stored file (marking it as accessed), or None if it doesn't exist."""
+        try:
+            path = self.path_for(key)
+            os.utime(path)
+        except (ValueError, FileNotFoundError):
+            return None
+        return path
+
+    # --- Eviction ---
+
+    def _iter_files(self):
+        for first in os.scandir(self.root):
+            if not first.is_dir() or first.name == "tmp":
+                continue
+            for second in os.scandir(first.path):
+                if second.is_dir():
+                    for entry in os.scandir(second.path):
+                        if entry.is_file():
+                            yield entry
+
+    def sweep(self, now: Optional[float] = None) -> Tuple[int, int]:
+        """Applies the TTL and size quota. Returns (files removed, bytes freed)."""
+        now = time.time() if now is None else now
+        removed, freed = evict_files(self._iter_files(), self.ttl_seconds, self.max_bytes, now)
+
+        # Temp files left behind by crashed requests
+        for entry in os.scandir(self.tmp_dir):
+            try:
+                if now - entry.stat().st_mtime > max(self.ttl_seconds or 0, 3600):
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        return removed, freed
+
+    def start_sweeper(self, interval_seconds: float = 600) -> threading.Thread:
+        """Runs sweep() every interval_seconds on a daemon thread."""
+        if self._sweeper is None:
+            self._sweeper = run_sweeper(self.root, self.sweep, interval_seconds)
+        return self._sweeper
+
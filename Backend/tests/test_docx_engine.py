@@ -0,0 +1,83 @@
+import io
+import zipfile
+
+from docx_engine import extract_docx, write_sanitized_docx
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+DOCUMENT = (
+    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<w:document {W}><w:body>'
+    '<w:p><w:r><w:rPr><w:b/></w:rPr><w:t>Card: 1234 </w:t></w:r><w:r><w:t xml:space="preserve">5678 9012</w:t></w:r>'
+    '<w:r><w:t> 3456 &amp; more</w:t></w:r></w:p>'
+    '<w:tbl><w:tr><w:tc><w:p><w:r><w:t>Phone</w:t></w:r><w:r><w:tab/><w:t>555-123-4567</w:t></w:r></w:p></w:tc></w:tr></w:tbl>'
+    '<w:p><w:r><w:t>Ünïcode &lt;tag&gt; stays</w:t></w:r></w:p>'
+    '</w:body></w:document>'
+)
+FOOTER = f'<?xml version="1.0" encoding="UTF-8"?><w:ftr {W}><w:p><w:r><w:t>Footer 987-65-4321</w:t></w:r></w:p></w:ftr>'
+OTHER_MEMBERS = {
+    "[Content_Types].xml": b'<?xml version="1.0"?><Types/>',
+    "word/media/image1.png": bytes(range(256)) * 4,
+}
+
+
+def make_docx() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in OTHER_MEMBERS.items():
+            archive.writestr(name, content)
+        archive.writestr("word/document.xml", DOCUMENT.encode("utf-8"))
+        archive.writestr("word/footer1.xml", FOOTER.encode("utf-8"))
+    return buffer.getvalue()
+
+
+def replace(text, value, replacement):
+    start = text.index(value)
+    return start, start + len(value), replacement
+
+
+def test_extracts_text_in_reading_order():
+    text = extract_docx(make_docx()).text
+    assert text == "Card: 1234 5678 9012 3456 & more\nPhone\t555-123-4567\nÜnïcode <tag> stays\nFooter 987-65-4321\n"
+
+
+def test_round_trip_applies_replacements_to_runs():
+    source = make_docx()
+    docx_text = extract_docx(source)
+    text = docx_text.text
+    # The card number spans three runs; the others sit inside one run
+    replacements = [
+        replace(text, "1234 5678 9012 3456", "4000 0000 0000 0002"),
+        replace(text, "555-123-4567", "999-999-9999 <&>"),
+        replace(text, "987-65-4321", "000-00-0000"),
+    ]
+    output = io.BytesIO()
+    runs_rewritten = write_sanitized_docx(source, docx_text, replacements, output)
+
+    expected, last = [], 0
+    for start, end, replacement in sorted(replacements):
+        expected += [text[last:start], replacement]
+        last = end
+    expected.append(text[last:])
+    assert extract_docx(output.getvalue()).text == "".join(expected)
+    assert runs_rewritten == 5
+
+    with zipfile.ZipFile(io.BytesIO(source)) as before, zipfile.ZipFile(io.BytesIO(output.getvalue())) as after:
+        assert after.namelist() == before.namelist()
+        for name, content in OTHER_MEMBERS.items():
+            assert after.read(name) == content
+        # Everything outside the rewritten <w:t> contents is byte-identical
+        document = after.read("word/document.xml").decode("utf-8")
+        assert document.startswith(DOCUMENT[:DOCUMENT.index("Card:")])
+        assert '<w:rPr><w:b/></w:rPr><w:t>Card: 4000 0000 0000 0002</w:t>' in document
+        assert '<w:t xml:space="preserve"></w:t>' in document
+        assert '<w:t> &amp; more</w:t>' in document
+        assert '<w:t>999-999-9999 &lt;&amp;&gt;</w:t>' in document
+        assert document.endswith(DOCUMENT[DOCUMENT.index("<w:p><w:r><w:t>Ünïcode"):])
+
+
+def test_no_replacements_copies_parts_unchanged():
+    source = make_docx()
+    output = io.BytesIO()
+    assert write_sanitized_docx(source, extract_docx(source), [], output) == 0
+    with zipfile.ZipFile(io.BytesIO(source)) as before, zipfile.ZipFile(io.BytesIO(output.getvalue())) as after:
+        for name in before.namelist():
+            assert after.read(name) == before.read(name)
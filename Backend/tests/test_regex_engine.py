@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+import regex_engine
+from regex_engine import CompiledPattern, ScanBudget, iter_matches, scan
+
+SEPARATORS = ["", " ", " ", "-", ".", "+", "(", ")", "\n", "a", "x@b.co "]
+CHUNK_SIZE = 64
+# Narrower than the longest PII matches; bounded patterns widen it themselves
+CHUNK_OVERLAP = 4
+
+
+def all_patterns():
+    try:
+        from pii_analyzer import PII_PATTERNS, REPLACEMENT_PATTERNS
+    except ImportError:
+        # pii_analyzer imports spaCy; the other tests here run without it
+        return [pytest.param(None, id="pii_patterns", marks=pytest.mark.skip(reason="pii_analyzer needs spaCy"))]
+    patterns = [CompiledPattern(f"detect.{k}", v, True, "re") for k, v in PII_PATTERNS.items()]
+    patterns += [CompiledPattern(f"replace.{k}", v, False, "re") for k, v in REPLACEMENT_PATTERNS.items()]
+    return [pytest.param(compiled, id=compiled.name) for compiled in patterns]
+
+
+def digit_heavy_text(rng):
+    """Runs of digits with the separators PII patterns look for, so near-matches straddle chunk boundaries."""
+    groups = ("".join(rng.choice("0123456789") for _ in range(rng.randint(1, 6))) for _ in range(rng.randint(0, 80)))
+    return "".join(group + rng.choice(SEPARATORS) for group in groups)
+
+
+def chunked(compiled, text):
+    return [(m.start(), m.end()) for m in iter_matches(compiled, text)]
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Small chunks put many chunk boundaries inside short test strings
+    monkeypatch.setattr(regex_engine, "SCAN_CHUNK_SIZE", CHUNK_SIZE)
+    monkeypatch.setattr(regex_engine, "SCAN_CHUNK_OVERLAP", CHUNK_OVERLAP)
+
+
+@pytest.mark.parametrize("compiled", all_patterns())
+def test_chunked_scan_matches_single_pass(small_chunks, compiled):
+    rng = random.Random(compiled.name)
+    for _ in range(3000):
+        text = digit_heavy_text(rng)
+        expected = [(m.start(), m.end()) for m in compiled.regex.finditer(text)]
+        if compiled.overlap is None and any(end - start > CHUNK_OVERLAP for start, end in expected):
+            continue
+        assert chunked(compiled, text) == expected, text
+
+
+def test_match_cut_by_window_is_extended(small_chunks):
+    compiled = CompiledPattern("digits", r"\d+", engine="re")
+    text = "x" * (CHUNK_SIZE - 5) + "1" * 200 + "y"
+    assert chunked(compiled, text) == [(CHUNK_SIZE - 5, CHUNK_SIZE + 195)]
+
+
+def test_expired_budget_reports_incomplete_patterns():
+    budget = ScanBudget(0)
+    result = scan({"digits": CompiledPattern("digits", r"\d+")}, "123 456", budget)
+    assert not result.complete
+    assert result.incomplete == {"digits": 0}
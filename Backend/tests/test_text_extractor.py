@@ -0,0 +1,37 @@
+import fitz
+import pytest
+
+# text_extractor imports pytesseract at module level
+pytest.importorskip("pytesseract")
+from text_extractor import extract_pdf_pages
+
+# Maps the glyphs for "1", "2" and "3" to the glyph for "9"
+DIGITS_AS_NINES = "<</Type/Encoding/BaseEncoding/WinAnsiEncoding/Differences[49/nine 50/nine 51/nine]>>"
+
+
+def make_pdf(encoding=None) -> bytes:
+    with fitz.open() as doc:
+        page = doc.new_page()
+        page.insert_text((72, 72), "ssn 123-45-6789", fontname="helv")
+        if encoding is not None:
+            xref = page.get_fonts()[0][0]
+            doc.xref_set_key(xref, "Encoding", encoding)
+        return doc.tobytes()
+
+
+def test_same_page_keeps_its_fingerprint():
+    (first, _), = extract_pdf_pages(make_pdf())
+    (second, _), = extract_pdf_pages(make_pdf())
+    assert first == second
+
+
+def test_font_encoding_change_changes_fingerprint():
+    (before, before_text), = extract_pdf_pages(make_pdf())
+    (after, after_text), = extract_pdf_pages(make_pdf(DIGITS_AS_NINES))
+    # Same content stream, different text layer
+    assert before_text.strip() == "ssn 123-45-6789"
+    assert after_text.strip() == "ssn 999-45-6789"
+    assert before != after
+    # A known fingerprint skips extraction, so a stale match would reuse the old text
+    (_, text), = extract_pdf_pages(make_pdf(DIGITS_AS_NINES), {before})
+    assert text == after_text
@@ -1,35 +1,97 @@
 import io
-import docx
+import re
+from typing import Container, List, Optional, Tuple
 import fitz  # PyMuPDF
 from PIL import Image
 import pytesseract
 
+from page_cache import fingerprint_bytes
+from docx_engine import extract_docx_text
+
 def extract_text(content_type: str, file_content: bytes) -> str:
     """
     Extracts text from a file's content based on its MIME type.
+    Errors are reported in the returned text; use extract_text_strict
+    to get an exception instead.
     """
     try:
-        if "image" in content_type:
-            image = Image.open(io.BytesIO(file_content)).convert("RGB")
-            return pytesseract.image_to_string(image)
-        
-        elif "pdf" in content_type:
-            text = ""
-            with fitz.open(stream=file_content, filetype="pdf") as doc:
-                for page in doc:
-                    text += page.get_text()
-            return text
-            
-        elif "text" in content_type or "csv" in content_type or "json" in content_type:
-            return file_content.decode('utf-8', errors='ignore')
-
-        elif "openxmlformats-officedocument.wordprocessingml" in content_type: # .docx
-            doc = docx.Document(io.BytesIO(file_content))
-            return "\n".join([para.text for para in doc.paragraphs])
-            
-        else:
-            return "Unsupported file type for text extraction."
-
+        return extract_text_strict(content_type, file_content)
+    except UnsupportedFileType:
+        return "Unsupported file type for text extraction."
     except Exception as e:
         print(f"❌ Error extracting text from {content_type}: {e}")
-        return f"Could not extract text from the document. Error: {e}"
\ No newline at end of file
+        return f"Could not extract text from the document. Error: {e}"
+
+
+class UnsupportedFileType(ValueError):
+    pass
+
+
+def extract_text_strict(content_type: str, file_content: bytes) -> str:
+    """Same as extract_text, but raises if the file can't be read."""
+    if "image" in content_type:
+        image = Image.open(io.BytesIO(file_content)).convert("RGB")
+        return pytesseract.image_to_string(image)
+
+    elif "pdf" in content_type:
+        text = ""
+        with fitz.open(stream=file_content, filetype="pdf") as doc:
+            for page in doc:
+                text += page.get_text()
+        return text
+
+    elif "text" in content_type or "csv" in content_type or "json" in content_type:
+        return file_content.decode('utf-8', errors='ignore')
+
+    elif "openxmlformats-officedocument.wordprocessingml" in content_type: # .docx
+        # Streams body, tables, headers and footers without building a document object
+        return extract_docx_text(file_content)
+
+    raise UnsupportedFileType(f"Unsupported file type for text extraction: {content_type}")
+
+
+# Font entries that change which characters a page's text layer maps its glyphs to
+FONT_TEXT_KEYS = ("ToUnicode", "Encoding", "DescendantFonts")
+
+
+def _font_chunks(doc: "fitz.Document", xref: int) -> List[bytes]:
+    """The font's dictionary plus the encoding and ToUnicode objects it refers to."""
+    chunks = [doc.xref_object(xref, compressed=True).encode("latin-1")]
+    for key in FONT_TEXT_KEYS:
+        # Inline values are already part of the font's dictionary
+        _, value = doc.xref_get_key(xref, key)
+        for ref in re.findall(r"(\d+) 0 R", value):
+            chunks.append(doc.xref_object(int(ref), compressed=True).encode("latin-1"))
+            chunks.append(doc.xref_stream_raw(int(ref)) or b"")
+    return chunks
+
+
+def fingerprint_pdf_page(doc: "fitz.Document", page: "fitz.Page") -> str:
+    """
+    Hashes everything that determines a PDF page's text layer: its content
+    streams, the form XObjects it draws, the fonts and encodings that map its
+    glyphs to text, and its geometry. This is far cheaper than running text
+    extraction on the page.
+    """
+    chunks = [page.read_contents(), f"{page.rect}|{page.rotation}".encode("ascii")]
+    for xref, *_ in page.get_xobjects():
+        chunks.append(doc.xref_stream_raw(xref) or b"")
+    for xref, *_ in page.get_fonts(full=True):
+        if xref > 0:
+            chunks.extend(_font_chunks(doc, xref))
+    return fingerprint_bytes(*chunks)
+
+
+def extract_pdf_pages(file_content: bytes, known_fingerprints: Container[str] = ()) -> List[Tuple[str, Optional[str]]]:
+    """
+    Returns a (fingerprint, text) pair for every page of a PDF.
+    Text is only extracted for pages whose fingerprint is not in
+    known_fingerprints; for known pages it is None.
+    """
+    pages = []
+    with fitz.open(stream=file_content, filetype="pdf") as doc:
+        for page in doc:
+            fingerprint = fingerprint_pdf_page(doc, page)
+            text = None if fingerprint in known_fingerprints else page.get_text()
+            pages.append((fingerprint, text))
+    return pages